@@ -0,0 +1,82 @@
+"""Measure the CPU time spent per GB downloaded for several block sizes
+
+Usage: python benchmarks/bench_download.py [--size-mb N]
+
+The file is served by `python -m http.server` in a separate process so only
+the client's CPU time is measured.
+"""
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pytcga.tcga_requests import download_file
+
+BLOCK_SIZES = [('1 KB', 1024), ('64 KB', 64 * 1024), ('1 MB', 1024 * 1024), ('adaptive', None)]
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def _wait_for_server(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError('HTTP server did not start')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    serve_dir = tempfile.mkdtemp(prefix='pytcga-bench-serve-')
+    output_dir = tempfile.mkdtemp(prefix='pytcga-bench-download-')
+    with open(os.path.join(serve_dir, 'archive.tar'), 'wb') as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'http.server', str(port),
+                               '--bind', '127.0.0.1', '--directory', serve_dir],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_server(port)
+        url = 'http://127.0.0.1:{}/archive.tar'.format(port)
+        gigabytes = args.size_mb / 1024.
+
+        print('{:<10} {:>16} {:>14}'.format('block', 'CPU s per GB', 'MB/s'))
+        for (name, block_size) in BLOCK_SIZES:
+            cpu = []
+            wall = []
+            for _ in range(args.repeat):
+                cpu_start = time.process_time()
+                wall_start = time.perf_counter()
+                download_file(url, os.path.join(output_dir, 'archive.tar'), block_size=block_size)
+                cpu.append(time.process_time() - cpu_start)
+                wall.append(time.perf_counter() - wall_start)
+            print('{:<10} {:>16.3f} {:>14.1f}'.format(
+                name, min(cpu) / gigabytes, args.size_mb / min(wall)))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(serve_dir)
+        shutil.rmtree(output_dir)
+
+if __name__ == '__main__':
+    main()
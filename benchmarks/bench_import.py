@@ -0,0 +1,44 @@
+"""Time `import pytcga` in fresh interpreters
+
+Usage: python benchmarks/bench_import.py [--repeat N]
+"""
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+
+STATEMENTS = [
+    ('import pytcga', 'import pytcga'),
+    ('import pytcga, use load_studies', 'import pytcga; pytcga.load_studies'),
+    ('import pytcga, use load_mutation_data', 'import pytcga; pytcga.load_mutation_data'),
+]
+
+TIMER = """
+import time
+start = time.perf_counter()
+{}
+print(time.perf_counter() - start)
+"""
+
+def time_statement(statement, repeat):
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=repository)
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', TIMER.format(statement)], env=env)
+        timings.append(float(output))
+    return sorted(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    for (name, statement) in STATEMENTS:
+        timings = time_statement(statement, args.repeat)
+        print('{:<40} median {:8.1f} ms  min {:8.1f} ms'.format(
+            name, 1000 * timings[len(timings) // 2], 1000 * timings[0]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Time the pytcga loaders end to end against a local stand-in server
+
+Usage: python benchmarks/bench_loaders.py [--patients N] [--mutations N]
+           [--samples N] [--genes N] [--repeat N] [--rate-mb N] [--loader NAME ...]
+
+Each loader is timed once with an empty cache (cold), which includes the
+request, download, extraction and parsing, and then `--repeat` times with
+the cache populated (warm). `--rate-mb` throttles the server to simulate a
+slow link.
+"""
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import StandInServer
+
+DISEASE_CODE = 'LUAD'
+
+def _loaders():
+    """List of (name, loader, setup), `setup` is run untimed before the cold
+    call of the loader"""
+    import pytcga
+
+    return [
+        ('load_studies', lambda: pytcga.load_studies(), None),
+        ('load_clinical_data', lambda: pytcga.load_clinical_data(DISEASE_CODE), None),
+        ('load_patient_samples', lambda: pytcga.load_patient_samples(DISEASE_CODE), None),
+        ('load_sample_and_analytes', lambda: pytcga.load_sample_and_analytes(DISEASE_CODE), None),
+        ('load_treatments', lambda: pytcga.load_treatments(DISEASE_CODE), None),
+        ('load_aliquots', lambda: pytcga.load_aliquots(DISEASE_CODE), None),
+        ('load_mutation_data', lambda: pytcga.load_mutation_data(DISEASE_CODE, wait_time=0.1), None),
+        ('load_mutation_data(with_clinical)',
+            lambda: pytcga.load_mutation_data(DISEASE_CODE, with_clinical=True, wait_time=0.1), None),
+        ('load_rnaseq_data', lambda: pytcga.load_rnaseq_data(DISEASE_CODE, wait_time=0.1), None),
+        ('rnaseq_gene_statistics', lambda: pytcga.rnaseq_gene_statistics(DISEASE_CODE, wait_time=0.1), None),
+    ]
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def _rows(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    return len(result)
+
+def _clear_memory():
+    from pytcga import tcga_cache, tcga_utils
+    tcga_cache.clear_memory_cache()
+    tcga_utils._studies_cache.clear()
+
+def run(server, loaders, repeat):
+    results = []
+    for (name, loader, setup) in loaders:
+        cache_dir = tempfile.mkdtemp(prefix='pytcga-bench-cache-')
+        server.configure_pytcga(cache_dir)
+        _clear_memory()
+        try:
+            if setup is not None:
+                setup()
+            cold, result = _timed(loader)
+            warm = []
+            for _ in range(repeat):
+                warm.append(_timed(loader)[0])
+            results.append((name, _rows(result), cold, min(warm) if warm else float('nan')))
+        finally:
+            shutil.rmtree(cache_dir)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=500)
+    parser.add_argument('--mutations', type=int, default=50000)
+    parser.add_argument('--samples', type=int, default=100)
+    parser.add_argument('--genes', type=int, default=20531)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--rate-mb', type=float,
+                        help='Serve files at this many MB per second')
+    parser.add_argument('--loader', action='append',
+                        help='Only run the named loaders')
+    parser.add_argument('--data-dir',
+                        help='Keep generated fixtures in this directory between runs')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='pytcga-bench-data-')
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    scale = dict(n_patients=args.patients,
+                 n_mutations=args.mutations,
+                 n_samples=args.samples,
+                 n_genes=args.genes)
+
+    loaders = [loader for loader in _loaders()
+               if not args.loader or loader[0] in args.loader]
+
+    try:
+        rate = int(args.rate_mb * 1024 * 1024) if args.rate_mb else None
+        with StandInServer(data_dir, scale=scale, rate=rate) as server:
+            server.prepare(DISEASE_CODE)
+            results = run(server, loaders, args.repeat)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir)
+
+    print('{:<36} {:>10} {:>12} {:>12}'.format('loader', 'rows', 'cold (s)', 'warm (s)'))
+    for (name, rows, cold, warm) in results:
+        print('{:<36} {:>10} {:>12.3f} {:>12.3f}'.format(name, rows, cold, warm))
+
+if __name__ == '__main__':
+    main()
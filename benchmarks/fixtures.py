@@ -0,0 +1,173 @@
+"""Synthetic TCGA data files for benchmarks
+
+Each generator is deterministic for a given seed and writes files in the
+layout served by TCGA: mutation archives of MAF files, RNASeqV2 archives of
+gene quantification files with a FILE_SAMPLE_MAP.txt, and directories of
+clinical and biospecimen biotab files.
+"""
+import io
+import os
+import tarfile
+import numpy as np
+
+CHROMOSOMES = [str(c) for c in range(1, 23)] + ['X', 'Y']
+VARIANT_TYPES = ['SNP', 'SNP', 'SNP', 'SNP', 'DEL', 'INS']
+VARIANT_CLASSIFICATIONS = ['Missense_Mutation', 'Silent', 'Nonsense_Mutation',
+                           'Frame_Shift_Del', 'Frame_Shift_Ins', 'Splice_Site']
+BASES = np.array(list('ACGT'))
+
+MAF_COLUMNS = ['Hugo_Symbol', 'Entrez_Gene_Id', 'Center', 'NCBI_Build',
+               'Chromosome', 'Start_position', 'End_position', 'Strand',
+               'Variant_Classification', 'Variant_Type', 'Reference_Allele',
+               'Tumor_Seq_Allele1', 'Tumor_Seq_Allele2', 'dbSNP_RS',
+               'Tumor_Sample_Barcode', 'Matched_Norm_Sample_Barcode']
+
+def patient_barcodes(n_patients, tss='AA'):
+    return ['TCGA-{}-{:04d}'.format(tss, i) for i in range(n_patients)]
+
+def aliquot_barcode(patient, sample_type='01', analyte='D', plate=0, center='08'):
+    return '{}-{}A-11{}-{:04d}-{}'.format(patient, sample_type, analyte, plate, center)
+
+def gene_ids(n_genes):
+    return ['GENE{}|{}'.format(i, 1000 + i) for i in range(n_genes)]
+
+def _add_bytes(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    archive.addfile(info, io.BytesIO(data))
+
+def maf_text(n_mutations, n_patients, n_genes=2000, seed=0):
+    rng = np.random.RandomState(seed)
+    patients = patient_barcodes(n_patients)
+    patient_index = rng.randint(n_patients, size=n_mutations)
+    gene_index = rng.randint(n_genes, size=n_mutations)
+    start = rng.randint(1, 2 * 10 ** 8, size=n_mutations)
+    variant_types = np.array(VARIANT_TYPES)[rng.randint(len(VARIANT_TYPES), size=n_mutations)]
+    classifications = np.array(VARIANT_CLASSIFICATIONS)[
+        rng.randint(len(VARIANT_CLASSIFICATIONS), size=n_mutations)]
+    chromosomes = np.array(CHROMOSOMES)[gene_index % len(CHROMOSOMES)]
+    reference = BASES[rng.randint(4, size=n_mutations)]
+    alternate = BASES[rng.randint(4, size=n_mutations)]
+
+    lines = ['\t'.join(MAF_COLUMNS)]
+    for i in range(n_mutations):
+        patient = patients[patient_index[i]]
+        lines.append('\t'.join([
+            'GENE{}'.format(gene_index[i]), str(1000 + gene_index[i]), 'broad.mit.edu', '37',
+            chromosomes[i], str(start[i]), str(start[i]), '+',
+            classifications[i], variant_types[i], reference[i],
+            reference[i], alternate[i], '[Not Available]',
+            aliquot_barcode(patient, '01'), aliquot_barcode(patient, '10')]))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def write_mutation_archive(path, n_mutations=50000, n_patients=500, n_files=2, seed=0):
+    """Write a Level 2 somatic mutation archive of `n_files` MAF files"""
+    with tarfile.open(path, 'w') as archive:
+        per_file = n_mutations // n_files
+        for i in range(n_files):
+            _add_bytes(archive,
+                       'broad.mit.edu_SYN.IlluminaGA_DNASeq.Level_2.{}.somatic.maf'.format(i),
+                       maf_text(per_file, n_patients, seed=seed + i))
+    return path
+
+def write_rnaseq_archive(path, n_samples=100, n_genes=20531, seed=0):
+    """Write a Level 3 RNASeqV2 archive with one gene quantification file per
+    sample and the FILE_SAMPLE_MAP.txt relating files to aliquot barcodes"""
+    rng = np.random.RandomState(seed)
+    genes = gene_ids(n_genes)
+    # Gene-level expression scale so that genes differ in mean and variance
+    scale = rng.lognormal(mean=3., sigma=2., size=n_genes)
+    patients = patient_barcodes(n_samples)
+
+    file_sample_map = ['filename\tbarcode(s)']
+    with tarfile.open(path, 'w') as archive:
+        for (i, patient) in enumerate(patients):
+            file_name = 'unc.edu.{:08d}.rsem.genes.normalized_results'.format(i)
+            file_sample_map.append('{}\t{}'.format(
+                file_name, aliquot_barcode(patient, '01', analyte='R', center='07')))
+
+            counts = rng.gamma(2., scale / 2.)
+            text = 'gene_id\tnormalized_count\n' + ''.join(
+                '{}\t{:.4f}\n'.format(gene, count) for (gene, count) in zip(genes, counts))
+            _add_bytes(archive, file_name, text.encode('utf-8'))
+
+        _add_bytes(archive, 'FILE_SAMPLE_MAP.txt',
+                   ('\n'.join(file_sample_map) + '\n').encode('utf-8'))
+    return path
+
+def _biotab(columns, cde_ids, rows, extra_header=None):
+    lines = ['\t'.join(columns)]
+    if extra_header is not None:
+        lines.append('\t'.join(extra_header))
+    lines.append('\t'.join(cde_ids))
+    lines.extend('\t'.join(row) for row in rows)
+    return '\n'.join(lines) + '\n'
+
+def write_biotab_directory(directory, disease_code, n_patients=500, n_centers=2, seed=0):
+    """Write patient, drug, sample, analyte and aliquot biotab files of a
+    disease into `directory`, the biospecimen tables split across centers"""
+    rng = np.random.RandomState(seed)
+    disease = disease_code.lower()
+    patients = patient_barcodes(n_patients)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    def write(file_name, text):
+        with open(os.path.join(directory, file_name), 'w') as f:
+            f.write(text)
+
+    patient_columns = ['bcr_patient_uuid', 'bcr_patient_barcode', 'gender',
+                       'age_at_initial_pathologic_diagnosis', 'tobacco_smoking_history',
+                       'vital_status', 'days_to_death']
+    patient_rows = [[
+        'uuid-{}'.format(patient), patient,
+        ['MALE', 'FEMALE'][rng.randint(2)],
+        str(rng.randint(30, 90)),
+        str(rng.randint(1, 6)),
+        ['Alive', 'Dead'][rng.randint(2)],
+        '[Not Available]' if rng.rand() < 0.5 else str(rng.randint(10, 4000))]
+        for patient in patients]
+    write('nationwidechildrens.org_clinical_patient_{}.txt'.format(disease),
+          _biotab(patient_columns,
+                  ['CDE_ID:'] * len(patient_columns),
+                  patient_rows,
+                  extra_header=patient_columns))
+
+    drug_columns = ['bcr_patient_uuid', 'bcr_patient_barcode', 'pharmaceutical_therapy_drug_name']
+    drug_rows = [['uuid-{}'.format(patient), patient, ['Cisplatin', 'Carboplatin', 'Pemetrexed'][rng.randint(3)]]
+                 for patient in patients if rng.rand() < 0.6]
+    write('nationwidechildrens.org_clinical_drug_{}.txt'.format(disease),
+          _biotab(drug_columns, ['CDE_ID:'] * len(drug_columns), drug_rows,
+                  extra_header=drug_columns))
+
+    for center in range(n_centers):
+        center_patients = patients[center::n_centers]
+        sample_rows = []
+        analyte_rows = []
+        aliquot_rows = []
+        for patient in center_patients:
+            for sample_type in ['01', '10']:
+                sample = '{}-{}A'.format(patient, sample_type)
+                sample_rows.append(['uuid-{}'.format(patient), sample, sample_type, 'A'])
+                for analyte in ['D', 'R']:
+                    analyte_rows.append([sample, '{}-11{}'.format(sample, analyte), analyte])
+                    aliquot_rows.append([aliquot_barcode(patient, sample_type, analyte),
+                                         'uuid-{}'.format(aliquot_barcode(patient, sample_type, analyte))])
+
+        suffix = '{}_{}'.format(disease, center)
+        write('nationwidechildrens.org_biospecimen_sample_{}.txt'.format(suffix),
+              _biotab(['bcr_patient_uuid', 'bcr_sample_barcode', 'sample_type_id', 'vial_number'],
+                      ['CDE_ID:'] * 4, sample_rows))
+        write('nationwidechildrens.org_biospecimen_analyte_{}.txt'.format(suffix),
+              _biotab(['bcr_sample_barcode', 'bcr_analyte_barcode', 'analyte_type_id'],
+                      ['CDE_ID:'] * 3, analyte_rows))
+        write('nationwidechildrens.org_biospecimen_aliquot_{}.txt'.format(suffix),
+              _biotab(['bcr_aliquot_barcode', 'bcr_aliquot_uuid'],
+                      ['CDE_ID:'] * 2, aliquot_rows))
+    return directory
+
+def studies_csv(disease_codes):
+    lines = ['BCR Batch Code,Study Abbreviation,Study Name']
+    for (i, code) in enumerate(disease_codes):
+        lines.append('{},{},Synthetic {} study'.format(i, code, code))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,215 @@
+"""Local stand-in for the TCGA web services
+
+Implements the parts of the protocol pytcga talks to:
+
+  GET  /tcga/damws/jobprocess/json?disease=...  submit a data request
+  GET  /status/<ticket>                         ticket status
+  GET  /archive/<ticket>.tar                    the finished archive
+  GET  /clin/<disease>/[file]                   biotab directory and files
+  POST /datareports/codeTablesExport.htm        study code table
+
+Archives and biotab directories are generated with `fixtures` on first use
+and kept in the server's data directory.
+"""
+import json
+import os
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer as ThreadingHTTPServer
+    from urlparse import urlparse, parse_qs
+
+import fixtures
+
+BLOCK_SIZE = 1024 * 1024
+
+class StandInServer(object):
+    """Serve synthetic TCGA data over HTTP on localhost
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory for the generated archives and biotab files
+    scale : dict, optional
+        Keyword arguments for the fixture generators: 'n_patients',
+        'n_mutations', 'n_samples' and 'n_genes'
+    status_polls : int, optional
+        Number of status requests answered 'Queued' before a ticket is 'OK'
+    mutation_center : str, optional
+        Sequencing center that has mutation data, others answer 204
+    rate : int, optional
+        Bytes per second files are sent at, by default unthrottled
+    """
+    def __init__(self, data_dir, scale=None, status_polls=0, mutation_center='BI', rate=None):
+        self.data_dir = data_dir
+        self.scale = dict(n_patients=500, n_mutations=50000, n_samples=100, n_genes=20531)
+        self.scale.update(scale or {})
+        self.status_polls = status_polls
+        self.mutation_center = mutation_center
+        self.rate = rate
+        self.tickets = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._httpd.server_port)
+
+    def start(self):
+        server = self
+
+        class Handler(StandInHandler):
+            stand_in = server
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def archive_path(self, params):
+        """Generate (once) and return the archive answering a request, None
+        if the request has no data"""
+        disease = params['disease']
+        platform_type = params.get('platformType')
+        with self._lock:
+            if platform_type == 'RNASeqV2':
+                path = os.path.join(self.data_dir, '{}_rnaseq.tar'.format(disease))
+                if not os.path.exists(path):
+                    fixtures.write_rnaseq_archive(path,
+                                                  n_samples=self.scale['n_samples'],
+                                                  n_genes=self.scale['n_genes'])
+                return path
+            elif platform_type == 'Somatic Mutations' and params.get('center') == self.mutation_center:
+                path = os.path.join(self.data_dir, '{}_mutations.tar'.format(disease))
+                if not os.path.exists(path):
+                    fixtures.write_mutation_archive(path,
+                                                    n_mutations=self.scale['n_mutations'],
+                                                    n_patients=self.scale['n_patients'])
+                return path
+        return None
+
+    def biotab_dir(self, disease):
+        path = os.path.join(self.data_dir, 'clin', disease.lower())
+        with self._lock:
+            if not os.path.exists(path):
+                fixtures.write_biotab_directory(path, disease, n_patients=self.scale['n_patients'])
+        return path
+
+    def prepare(self, disease):
+        """Generate all fixtures of a disease ahead of time"""
+        self.biotab_dir(disease)
+        self.archive_path({'disease': disease, 'platformType': 'RNASeqV2'})
+        self.archive_path({'disease': disease,
+                           'platformType': 'Somatic Mutations',
+                           'center': self.mutation_center})
+
+    def configure_pytcga(self, cache_dir):
+        """Point pytcga at this server and at `cache_dir` for its cache"""
+        from pytcga import tcga_requests, tcga_clinical, tcga_utils
+
+        tcga_requests.PYTCGA_BASE_DIRECTORY = cache_dir
+        tcga_requests.REQUEST_ADDRESS = self.url + '/tcga/damws/jobprocess/json'
+        tcga_clinical.TCGA_CLINICAL_URL = self.url + '/clin/{}/'
+        tcga_utils.CODE_TABLE_ADDRESS = self.url + '/datareports/codeTablesExport.htm'
+
+class StandInHandler(BaseHTTPRequestHandler):
+    stand_in = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type='application/json', status=200):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path, content_type='application/octet-stream'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        rate = self.stand_in.rate
+        block_size = min(BLOCK_SIZE, rate // 10) if rate else BLOCK_SIZE
+        start = time.time()
+        sent = 0
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                self.wfile.write(block)
+                sent += len(block)
+                if rate:
+                    time.sleep(max(0., start + float(sent) / rate - time.time()))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+
+        if url.path.startswith('/tcga/damws/jobprocess/json'):
+            self._submit(dict((k, v[0]) for (k, v) in parse_qs(url.query).items()))
+        elif parts[:1] == ['status'] and len(parts) == 2:
+            self._status(parts[1])
+        elif parts[:1] == ['archive'] and len(parts) == 2:
+            ticket = parts[1][:-len('.tar')]
+            self._send_file(self.stand_in.tickets[ticket]['path'])
+        elif parts[:1] == ['clin'] and len(parts) == 2:
+            directory = self.stand_in.biotab_dir(parts[1])
+            links = ''.join('<a href="{0}">{0}</a>\n'.format(f) for f in sorted(os.listdir(directory)))
+            self._send('<html><body>{}</body></html>'.format(links), content_type='text/html')
+        elif parts[:1] == ['clin'] and len(parts) == 3:
+            self._send_file(os.path.join(self.stand_in.biotab_dir(parts[1]), parts[2]),
+                            content_type='text/plain')
+        else:
+            self._send('Not found', content_type='text/plain', status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self._send(fixtures.studies_csv(['BRCA', 'LUAD', 'LUSC']), content_type='text/csv')
+
+    def _submit(self, params):
+        path = self.stand_in.archive_path(params)
+        if path is None:
+            self._send('<h2>HTTP STATUS 204 - No Content</h2>', content_type='text/html')
+            return
+
+        with self.stand_in._lock:
+            ticket = '{:08d}'.format(len(self.stand_in.tickets))
+            self.stand_in.tickets[ticket] = {'path': path, 'polls': 0}
+        self._send(json.dumps({
+            'ticket': ticket,
+            'submission-time': '2016-01-01 00:00:00',
+            'estimated-size': os.path.getsize(path),
+            'status-check-url': '{}/status/{}'.format(self.stand_in.url, ticket),
+        }))
+
+    def _status(self, ticket):
+        entry = self.stand_in.tickets[ticket]
+        entry['polls'] += 1
+        if entry['polls'] > self.stand_in.status_polls:
+            job_status = {'status-message': 'OK',
+                          'archive-url': '{}/archive/{}.tar'.format(self.stand_in.url, ticket)}
+        else:
+            job_status = {'status-message': 'Queued'}
+        self._send(json.dumps({'job-status': job_status}))
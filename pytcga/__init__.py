@@ -1,8 +1,64 @@
-from pytcga.tcga_requests import tcga_request, RequestError
-from pytcga.tcga_clinical import load_clinical_data, load_patient_data, load_patient_samples, load_patient_analytes, load_treatments, load_sample_and_analytes, load_aliquots
-from pytcga.tcga_mutations import load_mutation_data
-from pytcga.tcga_rna import load_rnaseq_data
-from pytcga.tcga_utils import load_studies
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+import importlib
+
+# Public names and the submodule defining them. Submodules, and the heavy
+# dependencies they import, are only loaded when one of their names is used.
+_LAZY_ATTRIBUTES = {
+    'tcga_request': 'tcga_requests',
+    'RequestError': 'tcga_requests',
+    'OfflineError': 'tcga_requests',
+    'set_offline': 'tcga_requests',
+    'load_clinical_data': 'tcga_clinical',
+    'load_patient_data': 'tcga_clinical',
+    'load_patient_samples': 'tcga_clinical',
+    'load_patient_analytes': 'tcga_clinical',
+    'load_treatments': 'tcga_clinical',
+    'load_sample_and_analytes': 'tcga_clinical',
+    'load_aliquots': 'tcga_clinical',
+    'load_biospecimen_table': 'tcga_clinical',
+    'load_mutation_data': 'tcga_mutations',
+    'load_rnaseq_data': 'tcga_rna',
+    'load_rnaseq_matrix': 'tcga_rna',
+    'rnaseq_gene_statistics': 'tcga_rna',
+    'top_variable_genes': 'tcga_rna',
+    'load_pancancer_data': 'tcga_pancancer',
+    'build_mutation_dataset': 'tcga_mutation_dataset',
+    'query_mutations': 'tcga_mutation_dataset',
+    'load_studies': 'tcga_utils',
+    'attach_columns': 'tcga_utils',
+    'Cohort': 'tcga_cohort',
+    'BarcodeIndex': 'tcga_barcode_index',
+    'load_barcode_index': 'tcga_barcode_index',
+    'register_clinical_codes': 'clinical_data_dictionary',
+    'clear_memory_cache': 'tcga_cache',
+    'set_memory_cache_size': 'tcga_cache',
+    'set_progress_handler': 'progress',
+    'log_progress': 'progress',
+    'print_progress': 'progress',
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+def _version():
+    from ._version import get_versions
+    return get_versions()['version']
+
+def __getattr__(name):
+    if name == '__version__':
+        value = _version()
+    elif name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module('.' + _LAZY_ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+    else:
+        # Submodules, e.g. pytcga.tcga_requests, as when they were imported eagerly
+        try:
+            value = importlib.import_module('.' + name, __name__)
+        except ImportError as e:
+            if getattr(e, 'name', None) != __name__ + '.' + name:
+                raise
+            raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | {'__version__'})
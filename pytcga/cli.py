@@ -0,0 +1,216 @@
+"""Command line interface, e.g.
+
+    pytcga prefetch LUAD BRCA --data-type clinical --data-type mutation
+"""
+from __future__ import print_function
+import sys
+import time
+import logging
+import argparse
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+
+from . import tcga_requests
+from .tcga_requests import cache_data_dir
+from .tcga_clinical import (request_clinical_data,
+                            load_clinical_data,
+                            load_biospecimen_table,
+                            BIOTAB_TABLES)
+from .tcga_barcode_index import load_barcode_index
+from .tcga_mutations import load_mutation_data, _extract_mutation_archive
+from .tcga_mutation_dataset import write_mutation_partitions, _require_pyarrow
+from .tcga_rna import _extract_rnaseq_archive
+from .tcga_pancancer import NETWORK_WORKERS
+from .instrumentation import span, SpanRecorder
+from .progress import set_progress_handler, print_progress, _format_bytes
+
+PREFETCH_SPAN = 'prefetch.cohort'
+
+def _prefetch_clinical(disease_code, wait_time=30, max_age=None):
+    patient_data_path = request_clinical_data(disease_code, cache=True, max_age=max_age)
+    # Build the parsed tables so jobs don't parse the text files again, some
+    # cohorts only have biotab files
+    if patient_data_path is not None:
+        load_clinical_data(disease_code)
+    for table_type in sorted(BIOTAB_TABLES):
+        try:
+            load_biospecimen_table(disease_code, table_type)
+        except ValueError as e:
+            logging.debug('Skipping {} table of {}: {}'.format(table_type, disease_code, e))
+    load_barcode_index(disease_code)
+
+def _prefetch_mutations(disease_code, wait_time=30):
+    _extract_mutation_archive(disease_code, wait_time=wait_time)
+
+def _prefetch_mutation_dataset(disease_code, wait_time=30):
+    write_mutation_partitions(load_mutation_data(disease_code, wait_time=wait_time), disease_code)
+
+def _prefetch_rnaseq(disease_code, wait_time=30):
+    _extract_rnaseq_archive(disease_code, wait_time=wait_time)
+
+# For each data type, the function downloading and extracting a cohort and
+# building its parsed caches
+PREFETCH_DATA_TYPES = {
+    'clinical': _prefetch_clinical,
+    'mutation': _prefetch_mutations,
+    'rnaseq': _prefetch_rnaseq,
+}
+
+def _prefetch_job(prefetch, disease_code, data_type, wait_time):
+    try:
+        with span(PREFETCH_SPAN, disease=disease_code, data_type=data_type):
+            prefetch(disease_code, wait_time=wait_time)
+    except Exception as e:
+        logging.warning('Unable to prefetch {} {}: {!r}'.format(disease_code, data_type, e))
+        return e
+    return None
+
+def _job_span(span):
+    while span is not None and span.name != PREFETCH_SPAN:
+        span = span.parent
+    return span
+
+def prefetch_cohorts(disease_codes,
+                     data_types=None,
+                     workers=NETWORK_WORKERS,
+                     wait_time=30,
+                     mutation_dataset=False,
+                     max_age=None):
+    """Download, extract and parse cohorts into the cache ahead of use
+
+    Parameters
+    ----------
+    disease_codes : list of str
+        TCGA disease codes
+    data_types : list of str, optional
+        'clinical', 'mutation' and/or 'rnaseq', by default all
+    workers : int, optional
+        Number of cohorts and data types prefetched at the same time
+    wait_time : int, optional
+        Time to wait for response from TCGA
+    mutation_dataset : bool, optional
+        Also write the mutations to the partitioned Parquet dataset queried
+        by `query_mutations`, requires pyarrow
+    max_age : int, optional
+        Seconds cached clinical files are considered fresh, older ones are
+        revalidated, by default they never expire
+
+    Returns
+    -------
+    report : Pandas dataframe
+        One row per cohort and data type with its 'status', 'seconds',
+        downloaded 'bytes' and 'error'
+    """
+    prefetch_functions = dict(PREFETCH_DATA_TYPES)
+    if mutation_dataset:
+        prefetch_functions['mutation'] = _prefetch_mutation_dataset
+    if max_age is not None:
+        prefetch_functions['clinical'] = partial(prefetch_functions['clinical'], max_age=max_age)
+    data_types = data_types or sorted(prefetch_functions)
+    for data_type in data_types:
+        if data_type not in prefetch_functions:
+            raise ValueError('Unknown data type {!r}, expected one of {}'.format(
+                data_type, ', '.join(sorted(prefetch_functions))))
+
+    jobs = [(code.upper(), data_type) for code in disease_codes for data_type in data_types]
+    errors = {}
+    with SpanRecorder() as recorder:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = dict((executor.submit(_prefetch_job, prefetch_functions[data_type],
+                                            code, data_type, wait_time), (code, data_type))
+                           for (code, data_type) in jobs)
+            for future in as_completed(futures):
+                errors[futures[future]] = future.result()
+
+    seconds = {}
+    downloaded = dict((job, 0) for job in jobs)
+    for recorded in recorder.spans:
+        job_span = _job_span(recorded)
+        if job_span is None:
+            continue
+        job = (job_span.attributes['disease'], job_span.attributes['data_type'])
+        if recorded is job_span:
+            seconds[job] = recorded.duration
+        elif recorded.name == 'download':
+            downloaded[job] += recorded.attributes.get('bytes', 0)
+
+    return pd.DataFrame({
+        'disease': [code for (code, _) in jobs],
+        'data_type': [data_type for (_, data_type) in jobs],
+        'status': ['ok' if errors[job] is None else 'failed' for job in jobs],
+        'seconds': [seconds.get(job) for job in jobs],
+        'bytes': [downloaded[job] for job in jobs],
+        'error': ['' if errors[job] is None else repr(errors[job]) for job in jobs],
+    }, columns=['disease', 'data_type', 'status', 'seconds', 'bytes', 'error'])
+
+def format_report(report, elapsed=None):
+    """Text summary of a `prefetch_cohorts` report"""
+    table = report.copy()
+    table['seconds'] = table['seconds'].map(lambda s: '{:.1f}'.format(s) if pd.notnull(s) else '')
+    table['bytes'] = table['bytes'].map(_format_bytes)
+    failed = (report['status'] != 'ok').sum()
+    summary = '{} of {} prefetched, {} downloaded'.format(
+        len(report) - failed, len(report), _format_bytes(report['bytes'].sum()))
+    if elapsed is not None:
+        summary += ' in {:.1f}s'.format(elapsed)
+    return '{}\n{}, cache in {}'.format(table.to_string(index=False), summary, cache_data_dir())
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog='pytcga', description='Store and query public TCGA data')
+    subparsers = parser.add_subparsers(dest='command')
+
+    prefetch = subparsers.add_parser(
+        'prefetch',
+        help='Download cohorts into the cache',
+        description='Download, extract and parse cohorts into the cache, e.g. '
+                    'to copy the cache to machines without network access')
+    prefetch.add_argument('disease_codes', nargs='+', metavar='DISEASE',
+                          help='TCGA disease codes, e.g. LUAD BRCA')
+    prefetch.add_argument('--data-type', action='append', dest='data_types',
+                          choices=sorted(PREFETCH_DATA_TYPES),
+                          help='Data type to prefetch, can be repeated, by default all')
+    prefetch.add_argument('--workers', type=int, default=NETWORK_WORKERS,
+                          help='Downloads running at the same time')
+    prefetch.add_argument('--wait-time', type=int, default=30,
+                          help='Seconds to wait for TCGA to prepare an archive')
+    prefetch.add_argument('--mutation-dataset', action='store_true',
+                          help='Also build the Parquet mutation dataset, requires pyarrow')
+    prefetch.add_argument('--max-age', type=int,
+                          help='Revalidate cached clinical files older than this many seconds')
+    prefetch.add_argument('--cache-dir',
+                          help='Cache directory, by default {}'.format(
+                              tcga_requests.PYTCGA_BASE_DIRECTORY))
+    prefetch.add_argument('--progress', action='store_true',
+                          help='Report the progress of downloads on stderr')
+    return parser
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    if args.mutation_dataset:
+        try:
+            _require_pyarrow()
+        except ImportError as e:
+            parser.error(str(e))
+    if args.cache_dir:
+        tcga_requests.PYTCGA_BASE_DIRECTORY = args.cache_dir
+    if args.progress:
+        set_progress_handler(print_progress)
+
+    start = time.time()
+    report = prefetch_cohorts(args.disease_codes,
+                              data_types=args.data_types,
+                              workers=args.workers,
+                              wait_time=args.wait_time,
+                              mutation_dataset=args.mutation_dataset,
+                              max_age=args.max_age)
+    print(format_report(report, elapsed=time.time() - start))
+    return 0 if (report['status'] == 'ok').all() else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
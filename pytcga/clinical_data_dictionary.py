@@ -1,4 +1,3 @@
-
 clinical_data_dictionary = {
    
     'tobacco_smoking_history':
@@ -10,4 +9,16 @@ clinical_data_dictionary = {
             '5': 'Current Reformed Smoker, Duration Not Specified',
 
         }
-}
\ No newline at end of file
+}
+
+def register_clinical_codes(column, codes):
+    """Add or extend the recoding of a coded clinical column
+
+    Parameters
+    ----------
+    column : str
+        Name of the clinical column
+    codes : dict
+        Mapping from the raw coded value to its description
+    """
+    clinical_data_dictionary.setdefault(column, {}).update(codes)
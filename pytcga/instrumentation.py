@@ -0,0 +1,147 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+_handlers = []
+_local = threading.local()
+
+class Span(object):
+    """A timed stage of a pytcga operation
+
+    Attributes
+    ----------
+    name : str
+        Name of the stage, e.g. 'mutations.parse'
+    attributes : dict
+        Counters and labels recorded for the stage, e.g. 'bytes', 'rows',
+        'files' or 'cache' ('hit' or 'miss')
+    parent : Span
+        Enclosing span in the same thread, None for a top-level span
+    duration : float
+        Wall-clock seconds spent in the stage, set when the span ends
+    """
+    def __init__(self, name, attributes, parent=None):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.start_time = time.time()
+        self.duration = None
+
+    def __repr__(self):
+        return 'Span({!r}, duration={}, {})'.format(self.name, self.duration, self.attributes)
+
+    def add(self, **counts):
+        """Increment counters, e.g. span.add(bytes=len(block))"""
+        for (key, value) in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def set(self, **attributes):
+        """Set labels, e.g. span.set(cache='hit')"""
+        self.attributes.update(attributes)
+
+    @property
+    def path(self):
+        """Names of the enclosing spans and this one, joined by '/'"""
+        if self.parent is None:
+            return self.name
+        return self.parent.path + '/' + self.name
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def current_span():
+    """The innermost active span of this thread, or None"""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+def add_handler(handler):
+    """Call `handler(span)` whenever a span ends"""
+    _handlers.append(handler)
+    return handler
+
+def remove_handler(handler):
+    if handler in _handlers:
+        _handlers.remove(handler)
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage and report it to the registered handlers
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage
+    attributes : optional
+        Initial attributes of the span
+
+    Yields
+    ------
+    span : Span
+        The span, to record counters with `add` and labels with `set`
+    """
+    stack = _stack()
+    current = Span(name, attributes, parent=stack[-1] if stack else None)
+    stack.append(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=repr(e))
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        stack.pop()
+        for handler in list(_handlers):
+            try:
+                handler(current)
+            except Exception:
+                logging.exception('Instrumentation handler {} failed'.format(handler))
+
+def logging_handler(level=logging.INFO, logger=None):
+    """Create a handler that logs each span as it ends"""
+    logger = logger or logging.getLogger('pytcga.instrumentation')
+
+    def log_span(span):
+        logger.log(level, '{} took {:.3f}s {}'.format(span.path, span.duration, span.attributes))
+    return log_span
+
+class SpanRecorder(object):
+    """Handler collecting the spans that end while it is registered
+
+    Examples
+    --------
+    >>> with SpanRecorder() as recorder:
+    ...     load_mutation_data('LUAD')
+    >>> recorder.summary()
+    """
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def __enter__(self):
+        add_handler(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_handler(self)
+
+    def summary(self):
+        """Total duration, count and summed numeric attributes per span name"""
+        import pandas as pd
+
+        rows = []
+        for span in self.spans:
+            row = {'name': span.name, 'duration': span.duration, 'count': 1}
+            row.update((key, value) for (key, value) in span.attributes.items()
+                       if isinstance(value, (int, float)) and not isinstance(value, bool))
+            rows.append(row)
+        if not rows:
+            return pd.DataFrame(columns=['duration', 'count'])
+        return pd.DataFrame(rows).groupby('name').sum()
@@ -0,0 +1,136 @@
+import sys
+import time
+import logging
+
+# Minimum seconds between two progress reports of the same download
+PROGRESS_INTERVAL = 1.0
+
+_progress_handler = [None]
+
+class DownloadProgress(object):
+    """State of a download, passed to progress handlers
+
+    Attributes
+    ----------
+    url : str
+        URL being downloaded
+    bytes_done : int
+        Bytes received so far
+    total_bytes : int
+        Expected size from Content-Length or the request's estimated size,
+        None if unknown
+    elapsed : float
+        Seconds since the download started
+    rate : float
+        Bytes per second since the previous report
+    average_rate : float
+        Bytes per second since the download started
+    finished : bool
+        True for the final report of a download
+    """
+    def __init__(self, url, total_bytes=None):
+        self.url = url
+        self.total_bytes = total_bytes
+        self.bytes_done = 0
+        self.elapsed = 0.
+        self.rate = 0.
+        self.finished = False
+
+    def __repr__(self):
+        return 'DownloadProgress({!r}, bytes_done={}, total_bytes={}, rate={:.0f})'.format(
+            self.url, self.bytes_done, self.total_bytes, self.rate)
+
+    @property
+    def average_rate(self):
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0.
+
+    @property
+    def fraction(self):
+        """Fraction of the download completed, None if the size is unknown"""
+        if not self.total_bytes:
+            return None
+        return min(float(self.bytes_done) / self.total_bytes, 1.)
+
+    @property
+    def eta(self):
+        """Estimated seconds remaining at the current rate, None if unknown"""
+        if self.finished:
+            return 0.
+        rate = self.rate or self.average_rate
+        if not self.total_bytes or rate <= 0:
+            return None
+        return max(self.total_bytes - self.bytes_done, 0) / rate
+
+class ProgressTracker(object):
+    """Accumulates the bytes of a download and reports to `handler` at most
+    every `interval` seconds"""
+    def __init__(self, handler, url, total_bytes=None, interval=PROGRESS_INTERVAL):
+        self.handler = handler
+        self.interval = interval
+        self.progress = DownloadProgress(url, total_bytes)
+        self._start = time.time()
+        self._last_report = self._start
+        self._last_bytes = 0
+
+    def update(self, nbytes):
+        self.progress.bytes_done += nbytes
+        if self.handler is None:
+            return
+        now = time.time()
+        if now - self._last_report >= self.interval:
+            self._report(now)
+
+    def finish(self):
+        self.progress.finished = True
+        if self.handler is not None:
+            self._report(time.time())
+
+    def _report(self, now):
+        progress = self.progress
+        progress.elapsed = now - self._start
+        if now > self._last_report:
+            progress.rate = (progress.bytes_done - self._last_bytes) / (now - self._last_report)
+        self._last_report = now
+        self._last_bytes = progress.bytes_done
+        self.handler(progress)
+
+def set_progress_handler(handler):
+    """Set the handler called with a `DownloadProgress` during downloads that
+    are not given their own, None disables progress reporting"""
+    _progress_handler[0] = handler
+
+def get_progress_handler():
+    return _progress_handler[0]
+
+def _format_bytes(nbytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(nbytes) < 1024:
+            return '{:.1f} {}'.format(nbytes, unit)
+        nbytes /= 1024.
+    return '{:.1f} TB'.format(nbytes)
+
+def format_progress(progress):
+    """One line summary of a download's progress"""
+    if progress.total_bytes:
+        done = '{} of {} ({:.0%})'.format(_format_bytes(progress.bytes_done),
+                                          _format_bytes(progress.total_bytes),
+                                          progress.fraction)
+    else:
+        done = _format_bytes(progress.bytes_done)
+    eta = progress.eta
+    return '{} {}, {}/s{}'.format(
+        progress.url,
+        done,
+        _format_bytes(progress.rate if not progress.finished else progress.average_rate),
+        ', ETA {:.0f}s'.format(eta) if eta is not None and not progress.finished else '')
+
+def log_progress(progress):
+    """Progress handler logging each report"""
+    logging.info(format_progress(progress))
+
+def print_progress(progress):
+    """Progress handler rewriting a single status line on stderr"""
+    sys.stderr.write('\r' + format_progress(progress))
+    if progress.finished:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
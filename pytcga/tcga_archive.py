@@ -0,0 +1,167 @@
+import os
+import json
+import queue
+import logging
+import tarfile
+import threading
+
+from .tcga_cache import file_fingerprint
+from .instrumentation import span
+
+# Records, in an extraction directory, the archive its files came from
+EXTRACTED_MARKER_FILE = '.pytcga_extracted.json'
+
+# Downloaded blocks buffered for a streaming extraction that falls behind
+STREAM_QUEUE_BLOCKS = 16
+
+def is_extracted(archive_path, extract_to):
+    """Whether `extract_to` holds the members of the current `archive_path`"""
+    marker_path = os.path.join(extract_to, EXTRACTED_MARKER_FILE)
+    if not os.path.exists(marker_path) or not os.path.exists(archive_path):
+        return False
+    try:
+        with open(marker_path) as f:
+            return json.load(f) == file_fingerprint([archive_path])
+    except ValueError:
+        return False
+
+def mark_extracted(archive_path, extract_to):
+    marker_path = os.path.join(extract_to, EXTRACTED_MARKER_FILE)
+    with open(marker_path, 'w') as f:
+        json.dump(file_fingerprint([archive_path]), f)
+
+def _extract_members(archive, extract_to, member_filter, on_extract, extract_span):
+    for member in archive:
+        if member_filter is None or member_filter(os.path.basename(member.name)):
+            archive.extract(member, path=extract_to)
+            extract_span.add(files=1, bytes=member.size)
+            if on_extract is not None:
+                on_extract(os.path.join(extract_to, member.name))
+
+def extract_archive(archive_path, extract_to, member_filter=None, on_extract=None):
+    """Extract the members of an archive unless they already were
+
+    Parameters
+    ----------
+    archive_path : str
+    extract_to : str
+        Directory to extract into
+    member_filter : callable, optional
+        Called with the file name of each member, only members for which it
+        returns True are extracted
+    on_extract : callable, optional
+        Called with the path of each member once it is extracted
+
+    Returns
+    -------
+    extract_to : str
+    """
+    if is_extracted(archive_path, extract_to):
+        return extract_to
+    if not os.path.exists(extract_to):
+        os.makedirs(extract_to)
+
+    with span('archive.extract', streamed=False) as extract_span:
+        with tarfile.open(archive_path) as archive:
+            _extract_members(archive, extract_to, member_filter, on_extract, extract_span)
+    mark_extracted(archive_path, extract_to)
+    return extract_to
+
+class _BlockPipe(object):
+    """File-like object reading the blocks written to it from another thread"""
+    def __init__(self, max_blocks=STREAM_QUEUE_BLOCKS):
+        self._queue = queue.Queue(max_blocks)
+        self._block = b''
+        self._offset = 0
+        self._eof = False
+
+    def write(self, block):
+        self._queue.put(bytes(block))
+
+    def close(self):
+        self._queue.put(None)
+
+    def _next_block(self):
+        block = self._queue.get()
+        if block is None:
+            self._eof = True
+            return False
+        self._block = block
+        self._offset = 0
+        return True
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0:
+            if self._offset >= len(self._block):
+                if self._eof or not self._next_block():
+                    break
+                continue
+            end = len(self._block) if size < 0 else min(len(self._block), self._offset + size)
+            chunks.append(self._block[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+        return b''.join(chunks)
+
+    def drain(self):
+        while not self._eof:
+            self._next_block()
+
+class StreamingExtractor(object):
+    """Extract a tar archive from its blocks as they are downloaded
+
+    Blocks passed to `write` are read by `tarfile` in stream mode on a
+    background thread, so members are extracted, and can be parsed by
+    `on_extract`, while the rest of the archive is still arriving.
+
+    Parameters
+    ----------
+    extract_to : str
+        Directory to extract into
+    member_filter : callable, optional
+        Called with the file name of each member, only members for which it
+        returns True are extracted
+    on_extract : callable, optional
+        Called on the background thread with the path of each member once it
+        is extracted
+    """
+    def __init__(self, extract_to, member_filter=None, on_extract=None):
+        self.extract_to = extract_to
+        self.member_filter = member_filter
+        self.on_extract = on_extract
+        self.error = None
+        self._pipe = _BlockPipe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        if not os.path.exists(self.extract_to):
+            os.makedirs(self.extract_to)
+        self._thread.start()
+        return self
+
+    def write(self, block):
+        self._pipe.write(block)
+
+    def _run(self):
+        try:
+            with span('archive.extract', streamed=True) as extract_span:
+                with tarfile.open(fileobj=self._pipe, mode='r|') as archive:
+                    _extract_members(archive, self.extract_to, self.member_filter,
+                                     self.on_extract, extract_span)
+        except Exception as e:
+            self.error = e
+        finally:
+            # Keep consuming so the download never blocks on a full queue
+            self._pipe.drain()
+
+    def finish(self):
+        """Signal the end of the archive and wait for the extraction, returns
+        True if it succeeded"""
+        self._pipe.close()
+        self._thread.join()
+        if self.error is not None:
+            logging.warning('Streaming extraction into {} failed: {!r}'.format(
+                self.extract_to, self.error))
+        return self.error is None
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+from .tcga_clinical import request_biotab_files, _biotab_files, BIOTAB_TABLES
+from .tcga_utils import (TCGA_BARCODE_LEVELS,
+                         TCGA_BARCODE_LENGTHS,
+                         barcode_column,
+                         barcode_prefix,
+                         load_tcga_tabfiles)
+from .tcga_cache import cached_table
+
+BARCODE_INDEX_TABLE = 'barcode_index'
+
+# Sorts after every character of a barcode, so the barcodes starting with a
+# prefix are those between the prefix and the prefix followed by it
+_PREFIX_END = '~'
+
+# Biotab tables the hierarchy is built from, finest level first
+_INDEX_LEVELS = ['aliquot', 'analyte', 'sample']
+
+def build_barcode_hierarchy(barcodes):
+    """One row per leaf of the biospecimen hierarchy with its barcode at
+    every level
+
+    Parameters
+    ----------
+    barcodes : list of str
+        Barcodes of any level. Barcodes that are a prefix of another one
+        only add their ancestors.
+
+    Returns
+    -------
+    hierarchy : Pandas dataframe
+        Columns 'patient', 'sample', 'portion', 'analyte' and 'aliquot',
+        missing below the level of each leaf, sorted by barcode
+    """
+    barcodes = np.unique(np.asarray(barcodes, dtype=str))
+    # In sorted order a barcode is a prefix of another only if it is a prefix
+    # of the next one
+    is_leaf = np.ones(len(barcodes), dtype=bool)
+    if len(barcodes) > 1:
+        is_leaf[:-1] = ~np.char.startswith(barcodes[1:], barcodes[:-1])
+    leaves = pd.Series(barcodes[is_leaf])
+
+    lengths = leaves.str.len()
+    hierarchy = pd.DataFrame(index=leaves.index)
+    for level in TCGA_BARCODE_LEVELS:
+        prefixes = barcode_prefix(leaves, level)
+        hierarchy[level] = prefixes.where(lengths >= TCGA_BARCODE_LENGTHS[level])
+    return hierarchy
+
+class BarcodeIndex(object):
+    """Lookups between the levels of the biospecimen hierarchy of a cohort,
+    patient -> sample -> portion -> analyte -> aliquot
+
+    Rows of the hierarchy are kept sorted by barcode, and since a barcode
+    starts with the barcodes of all its ancestors the rows under any barcode
+    are contiguous. Lookups are binary searches for that range, vectorized
+    over lists of barcodes.
+
+    Parameters
+    ----------
+    hierarchy : Pandas dataframe
+        As returned by `build_barcode_hierarchy`
+
+    Examples
+    --------
+    >>> index = load_barcode_index('LUAD')
+    >>> index.lookup('TCGA-05-4244-01A', 'aliquot')
+    >>> index.ancestor(mutations['Tumor_Sample_Barcode'], 'patient')
+    """
+    def __init__(self, hierarchy):
+        leaves = hierarchy[TCGA_BARCODE_LEVELS[0]].copy()
+        for level in TCGA_BARCODE_LEVELS[1:]:
+            leaves = hierarchy[level].fillna(leaves)
+        order = np.argsort(leaves.values.astype(str), kind='mergesort')
+        self.hierarchy = hierarchy.iloc[order].reset_index(drop=True)
+        self._leaves = leaves.values.astype(str)[order]
+
+    def __len__(self):
+        return len(self.hierarchy)
+
+    def __repr__(self):
+        return 'BarcodeIndex({})'.format(', '.join(
+            '{}={}'.format(level, self.hierarchy[level].nunique()) for level in TCGA_BARCODE_LEVELS))
+
+    def barcodes(self, level):
+        """All barcodes of a level"""
+        return self.hierarchy[level].dropna().unique()
+
+    def _ranges(self, barcodes):
+        barcodes = np.asarray(barcodes, dtype=str)
+        start = np.searchsorted(self._leaves, barcodes, side='left')
+        end = np.searchsorted(self._leaves, np.char.add(barcodes, _PREFIX_END), side='left')
+        return (barcodes, start, end)
+
+    def descendants(self, barcodes, level):
+        """Resolve barcodes to every related barcode of `level`
+
+        Parameters
+        ----------
+        barcodes : list of str
+            Barcodes of any level
+        level : str
+            Level to resolve to, finer or coarser than the barcodes
+
+        Returns
+        -------
+        resolved : Pandas dataframe
+            Columns 'barcode' and `level`, one row per pair, in the order of
+            `barcodes`. Barcodes not in the index have no rows.
+        """
+        (barcodes, start, end) = self._ranges(barcodes)
+        counts = end - start
+        # Row positions of each range, concatenated
+        offsets = np.repeat(start - np.cumsum(counts) + counts, counts)
+        rows = offsets + np.arange(counts.sum())
+        resolved = pd.DataFrame({'barcode': np.repeat(barcodes, counts),
+                                 level: self.hierarchy[level].values[rows]})
+        return resolved.dropna().drop_duplicates().reset_index(drop=True)
+
+    def ancestor(self, barcodes, level):
+        """Barcode of the coarser `level` of each barcode
+
+        Parameters
+        ----------
+        barcodes : list of str or Pandas series
+        level : str
+
+        Returns
+        -------
+        ancestors : Pandas series
+            Aligned with `barcodes`, missing for barcodes not in the index
+        """
+        index = barcodes.index if isinstance(barcodes, pd.Series) else None
+        (barcodes, start, end) = self._ranges(barcodes)
+        found = end > start
+        values = np.full(len(barcodes), np.nan, dtype=object)
+        # Every row under a barcode has the same ancestors, use the first
+        values[found] = self.hierarchy[level].values[start[found]]
+        return pd.Series(values, index=index)
+
+    def lookup(self, barcode, level):
+        """Barcodes of `level` related to a single barcode"""
+        return self.descendants([barcode], level)[level].tolist()
+
+def _load_table_barcodes(disease_code_dir, table_type):
+    (file_code, skiprows) = BIOTAB_TABLES[table_type]
+    column = barcode_column(table_type)
+    return [df[column] for df in load_tcga_tabfiles(_biotab_files(disease_code_dir, file_code),
+                                                    skiprows=skiprows,
+                                                    usecols=[column],
+                                                    dtype=str)]
+
+def load_barcode_index(disease_code, cache=True, max_age=None):
+    """Load the biospecimen barcode hierarchy of a cohort
+
+    The hierarchy is built from the sample, analyte and aliquot biotab
+    files and cached with the other parsed tables.
+
+    Parameters
+    ----------
+    disease_code : str
+        TCGA disease type, i.e. 'LUAD', 'BLCA', 'BRCA' etc.
+    cache : bool, optional
+        Whether to use and update the cache of parsed tables
+    max_age : int, optional
+        Seconds the downloaded files are considered fresh, see
+        `request_clinical_data`
+
+    Returns
+    -------
+    index : BarcodeIndex
+    """
+    disease_code_dir = request_biotab_files(disease_code, max_age=max_age)
+    source_paths = [path for level in _INDEX_LEVELS
+                    for path in _biotab_files(disease_code_dir, BIOTAB_TABLES[level][0])]
+
+    def build():
+        barcodes = [barcodes
+                    for level in _INDEX_LEVELS
+                    for barcodes in _load_table_barcodes(disease_code_dir, level)]
+        return build_barcode_hierarchy(pd.concat(barcodes, ignore_index=True).dropna()
+                                       if barcodes else [])
+
+    hierarchy = cached_table(disease_code_dir, BARCODE_INDEX_TABLE, source_paths, build, cache=cache)
+    return BarcodeIndex(hierarchy)
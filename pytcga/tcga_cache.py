@@ -0,0 +1,366 @@
+import os
+import json
+import logging
+import hashlib
+import uuid
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks, e.g. on Windows, the manifest is then only safe to
+    # update from the threads of a single process
+    fcntl = None
+
+from .instrumentation import span
+
+PARSED_CACHE_DIRECTORY = '.parsed'
+CACHE_MANIFEST_FILE = '.pytcga_manifest.json'
+# Locked while the manifest of a directory is updated, by any process
+MANIFEST_LOCK_FILE = '.pytcga_manifest.lock'
+
+# Hash recorded for downloaded files
+CHECKSUM_ALGORITHM = 'sha256'
+CHECKSUM_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Default upper bound on the memory held by loaded tables, in bytes
+DEFAULT_MEMORY_CACHE_BYTES = 2 * 1024 ** 3
+
+def _copy_on_write_enabled():
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except KeyError:
+        return False
+
+class DataFrameCache(object):
+    """Least-recently-used cache of dataframes bounded by their memory usage
+
+    Cached frames are never handed out directly, callers receive a copy
+    (a lazy one when pandas copy-on-write is enabled) so changes they make
+    don't leak into the cache.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Approximate upper bound on the memory used by cached frames
+    """
+    def __init__(self, max_bytes=DEFAULT_MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _copy(self, df):
+        return df.copy(deep=not _copy_on_write_enabled())
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            df, _ = self._entries[key]
+            return self._copy(df)
+
+    def put(self, key, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (self._copy(df), nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+memory_cache = DataFrameCache()
+
+def set_memory_cache_size(max_bytes):
+    """Set the approximate number of bytes of loaded tables kept in memory,
+    0 disables the in-memory cache"""
+    memory_cache.resize(max_bytes)
+
+def clear_memory_cache():
+    """Drop all tables held in the in-memory cache"""
+    memory_cache.clear()
+
+_manifest_lock = threading.Lock()
+
+def write_atomically(path, write):
+    """Call `write` with a temporary path next to `path` and move the result
+    into place, so readers never see a partial file and concurrent writers,
+    in any process, never share a temporary file"""
+    tmp_path = os.path.join(os.path.dirname(path),
+                            '.{}-{}.tmp'.format(os.path.basename(path), uuid.uuid4().hex))
+    # Created exclusively with the permissions of a plain open(), unlike the
+    # private files of tempfile.mkstemp
+    os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@contextmanager
+def _manifest_locked(directory):
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(directory, MANIFEST_LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_manifest(directory):
+    """Read the cache manifest of `directory`, a dict from file name to the
+    metadata recorded when the file was downloaded"""
+    manifest_path = os.path.join(directory, CACHE_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except ValueError:
+        logging.warning('Ignoring corrupt cache manifest {}'.format(manifest_path))
+        return {}
+
+def update_manifest(directory, entries):
+    """Merge `entries`, a dict from file name to metadata, into the cache
+    manifest of `directory`"""
+    manifest_path = os.path.join(directory, CACHE_MANIFEST_FILE)
+
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    # Re-read under the lock so entries written by other processes are kept
+    with _manifest_locked(directory):
+        manifest = read_manifest(directory)
+        for file_name, entry in entries.items():
+            manifest.setdefault(file_name, {}).update(entry)
+        write_atomically(manifest_path, write)
+    return manifest
+
+def is_fresh(entry, max_age):
+    """Whether a manifest entry was fetched or revalidated within `max_age`
+    seconds, a `max_age` of None never expires"""
+    if max_age is None:
+        return True
+    if not entry or 'fetched_at' not in entry:
+        return False
+    return time.time() - entry['fetched_at'] < max_age
+
+def file_checksum(path, algorithm=CHECKSUM_ALGORITHM):
+    """Hex digest of a file's contents"""
+    hasher = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(CHECKSUM_BLOCK_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def checksum_record(path, checksum, algorithm=CHECKSUM_ALGORITHM):
+    """Manifest fields recording the checksum, size and mtime of a file"""
+    stat = os.stat(path)
+    return {'checksum': checksum,
+            'algorithm': algorithm,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime}
+
+def verify_cached_file(path, full=False):
+    """Check a cached file against the checksum recorded when it was downloaded
+
+    By default only the size and modification time are compared, the file
+    is hashed if `full` is True or if only its modification time changed.
+
+    Parameters
+    ----------
+    path : str
+    full : bool, optional
+        Always compare the checksum of the contents
+
+    Returns
+    -------
+    valid : bool
+        True if the file matches its record, False if it is missing or
+        doesn't match, None if no checksum was recorded
+    """
+    (directory, file_name) = os.path.split(path)
+    entry = read_manifest(directory).get(file_name)
+    if not entry or 'checksum' not in entry:
+        return None
+    if not os.path.exists(path):
+        return False
+
+    stat = os.stat(path)
+    if stat.st_size != entry['size']:
+        return False
+    if not full and stat.st_mtime == entry['mtime']:
+        return True
+
+    valid = file_checksum(path, entry['algorithm']) == entry['checksum']
+    if valid and stat.st_mtime != entry['mtime']:
+        update_manifest(directory, {file_name: {'mtime': stat.st_mtime}})
+    return valid
+
+def verify_cache(directory, full=True):
+    """Verify every file with a recorded checksum under `directory`
+
+    Returns
+    -------
+    invalid : list of str
+        Paths of the files that are missing or don't match their checksum
+    """
+    invalid = []
+    for (root, dirs, files) in os.walk(directory):
+        if CACHE_MANIFEST_FILE not in files:
+            continue
+        for file_name in sorted(read_manifest(root)):
+            path = os.path.join(root, file_name)
+            if verify_cached_file(path, full=full) is False:
+                invalid.append(path)
+    return invalid
+
+def columnar_format():
+    """Returns the format used to store parsed tables, 'parquet' if pyarrow
+    is available, otherwise 'pickle'"""
+    try:
+        import pyarrow
+        return 'parquet'
+    except ImportError:
+        return 'pickle'
+
+def file_fingerprint(paths):
+    """Summarize the name, size and modification time of each file"""
+    fingerprint = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        fingerprint.append([os.path.basename(path), stat.st_size, stat.st_mtime])
+    return fingerprint
+
+def _cache_key(name, params):
+    params_hash = hashlib.md5(
+                        json.dumps(params, sort_keys=True).encode('utf-8')
+                    ).hexdigest()
+    return '{}-{}'.format(name, params_hash[:12])
+
+def _write_table(df, table_path, table_format):
+    if table_format == 'parquet':
+        write_atomically(table_path, df.to_parquet)
+    else:
+        write_atomically(table_path, df.to_pickle)
+
+def _read_table(table_path, table_format):
+    if table_format == 'parquet':
+        return pd.read_parquet(table_path)
+    else:
+        return pd.read_pickle(table_path)
+
+def cached_table(directory,
+                 name,
+                 source_paths,
+                 loader,
+                 params=None,
+                 cache=True):
+    """Load a parsed table from memory or the columnar cache, or build and
+    store it
+
+    The table is stored under `directory` alongside its source files and
+    reused until any source file changes size or modification time. Recently
+    used tables are also kept in `memory_cache`.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the source files
+    name : str
+        Name of the table
+    source_paths : list of str
+        Files the table is parsed from
+    loader : callable
+        Function of no arguments that parses the table
+    params : dict, optional
+        Options that change the parsed result, part of the cache key
+    cache : bool, optional
+        Whether to read and write the cache
+
+    Returns
+    -------
+    df : Pandas dataframe
+    """
+    if not cache:
+        return loader()
+
+    table_format = columnar_format()
+    key = _cache_key(name, params or {})
+    cache_dir = os.path.join(directory, PARSED_CACHE_DIRECTORY)
+    table_path = os.path.join(cache_dir, '{}.{}'.format(key, table_format))
+    fingerprint_path = os.path.join(cache_dir, '{}.json'.format(key))
+
+    with span('load_table', table=name) as table_span:
+        fingerprint = file_fingerprint(source_paths)
+        memory_key = (os.path.abspath(directory), key, json.dumps(fingerprint))
+        df = memory_cache.get(memory_key)
+        if df is not None:
+            table_span.set(cache='memory')
+            return df
+
+        if os.path.exists(table_path) and os.path.exists(fingerprint_path):
+            with open(fingerprint_path) as f:
+                if json.load(f) == fingerprint:
+                    logging.debug('Loading parsed {} from {}'.format(name, table_path))
+                    df = _read_table(table_path, table_format)
+                    memory_cache.put(memory_key, df)
+                    table_span.set(cache='disk', rows=len(df))
+                    return df
+
+        with span('parse', files=len(source_paths)) as parse_span:
+            df = loader()
+            parse_span.add(rows=len(df))
+        table_span.set(cache='miss', rows=len(df))
+        memory_cache.put(memory_key, df)
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    try:
+        _write_table(df, table_path, table_format)
+    except Exception as e:
+        logging.warning('Unable to cache parsed {}: {}'.format(name, e))
+        return df
+
+    with open(fingerprint_path, 'w') as f:
+        json.dump(fingerprint, f)
+
+    return df
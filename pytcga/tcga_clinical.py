@@ -1,21 +1,40 @@
 import os
+import time
 import logging
 import requests
-from bs4 import BeautifulSoup
+import numpy as np
 import pandas as pd
 
-from .tcga_requests import cache_data_dir
-from .tcga_utils import load_tcga_tabfile
+from .tcga_requests import cache_data_dir, download_file, is_offline, check_online, NETWORK_TIMEOUT
+from .tcga_utils import load_tcga_tabfile, load_tcga_tabfiles
+from .tcga_cache import cached_table, read_manifest, update_manifest, is_fresh
 from .clinical_data_dictionary import clinical_data_dictionary
+from .instrumentation import span
 
 TCGA_CLINICAL_URL = "https://tcga-data.nci.nih.gov/tcgafiles/ftp_auth/distro_ftpusers/anonymous/tumor/{}/bcr/biotab/clin/"
 
 PATIENT_DATA_FILE_CODE = 'clinical_patient'
+
+def _patient_data_file(file_names, manifest):
+    """The patient data file among `file_names`, there can be several when
+    the site renamed it, prefer those recorded in the manifest then the first
+    by name so the choice doesn't change between calls"""
+    candidates = sorted(f for f in file_names if PATIENT_DATA_FILE_CODE in f)
+    recorded = [f for f in candidates if f in manifest]
+    candidates = recorded or candidates
+    return candidates[0] if candidates else None
 def request_clinical_data(disease_code,
                   cache=True,
-                  block_size=1024):
+                  block_size=None,
+                  max_age=None,
+                  progress=None):
     """Downloads TCGA public clinical data from the TCGA FTP site
 
+    The ETag and Last-Modified headers of each file are recorded in the cache
+    manifest, files older than `max_age` are revalidated with a conditional
+    request and only downloaded again if they changed. In offline mode, see
+    `set_offline`, cached files are used regardless of their age.
+
     Parameters
     ----------
     disease_code : str
@@ -23,77 +42,185 @@ def request_clinical_data(disease_code,
     cache : bool, optional
         Whether to cache the results of the request
     block_size : int, optional
-        Block size for file downloads
+        Block size for file downloads, by default adapted to the throughput
+    max_age : int, optional
+        Seconds a cached file is considered fresh, by default cached files
+        never expire
+    progress : callable, optional
+        Called with a `DownloadProgress` while each file downloads
 
     Returns
     -------
     patient_data_path : str
-        Path to TCGA patient data file after downloading
+        Path to TCGA patient data file after downloading, None if the cohort
+        has no patient file
     """
     # Create directory to save clinical data
     disease_code_dir = os.path.join(cache_data_dir(), disease_code)
 
+    manifest = {}
     if cache and os.path.exists(disease_code_dir):
-        patient_data_file = [f for f in os.listdir(disease_code_dir) if PATIENT_DATA_FILE_CODE in f]
-
-        if len(patient_data_file) == 1:
-            return os.path.join(disease_code_dir, patient_data_file[0])
+        manifest = read_manifest(disease_code_dir)
+        file_names = os.listdir(disease_code_dir)
+        patient_data_file = _patient_data_file(file_names, manifest)
+
+        if patient_data_file is not None and \
+                (is_offline() or is_fresh(manifest.get(patient_data_file), max_age)):
+            return os.path.join(disease_code_dir, patient_data_file)
+
+        # Cohorts without a patient file are cached once every file recorded
+        # in the manifest is, offline the files cached are used as they are
+        if patient_data_file is None:
+            if is_offline() and any(f.endswith('.txt') for f in file_names):
+                return None
+            if manifest and all(os.path.exists(os.path.join(disease_code_dir, f)) and
+                                is_fresh(entry, max_age)
+                                for (f, entry) in manifest.items()):
+                return None
+
+    check_online('clinical data for {}'.format(disease_code))
 
     if not os.path.exists(disease_code_dir):
         os.makedirs(disease_code_dir)
 
+    from bs4 import BeautifulSoup
+
     clinical_data_directory = TCGA_CLINICAL_URL.format(disease_code.lower())
-    r = requests.get(clinical_data_directory)
-    soup = BeautifulSoup(r.content, "html.parser")
+    with span('clinical.list', disease=disease_code):
+        r = requests.get(clinical_data_directory, timeout=NETWORK_TIMEOUT)
+        soup = BeautifulSoup(r.content, "html.parser")
 
     # Retrieve list of files and filter to txt files
     file_links = [link.get('href')
                     for link in soup.find_all('a')]
-    clinical_files = [link for link in file_links if link.endswith('.txt')]
+    clinical_files = [link for link in file_links if link and link.endswith('.txt')]
 
-    # Download all clinical data files
-    patient_data_path = None
+    # Download all clinical data files that are missing, stale or changed
     for clinical_file in clinical_files:
         output_file = os.path.join(disease_code_dir, clinical_file)
+
+        entry = manifest.get(clinical_file) if os.path.exists(output_file) else None
+        if entry and is_fresh(entry, max_age):
+            continue
+
         logging.debug('Saving {} clinical data request to {}'.format(clinical_file, output_file))
+        record = download_file(clinical_data_directory + '/' + clinical_file,
+                               output_file,
+                               block_size=block_size,
+                               validators=entry,
+                               progress=progress)
+        if record is None:
+            update_manifest(disease_code_dir, {clinical_file: {'fetched_at': time.time()}})
+        else:
+            record['fetched_at'] = time.time()
+            update_manifest(disease_code_dir, {clinical_file: record})
+
+    patient_data_file = _patient_data_file(clinical_files, read_manifest(disease_code_dir))
+    if patient_data_file is None:
+        return None
+    return os.path.join(disease_code_dir, patient_data_file)
 
-        if PATIENT_DATA_FILE_CODE in output_file:
-            patient_data_path = output_file
+def load_patient_data(disease_code, recode_columns=True):
+    return load_clinical_data(disease_code, recode_columns)
 
-        with open(output_file, 'wb') as archive:
-            archive_response = requests.get(clinical_data_directory + '/' + clinical_file, stream=True)
+def recode_series(series, codes, categorical=False):
+    """Replace coded values in a series with their descriptions
 
-            for block in archive_response.iter_content(block_size):
-                archive.write(block)
+    Each distinct value is looked up once and the result is broadcast back
+    with its integer codes, so the cost scales with the number of unique
+    values rather than the number of rows.
 
-    return patient_data_path
+    Parameters
+    ----------
+    series : Pandas series
+    codes : dict
+        Mapping from raw value to description, unmapped values are kept
+    categorical : bool, optional
+        If True, return a categorical series
 
-def load_patient_data(disease_code, recode_columns=True):
-    return load_clinical_data(disease_code, recode_columns)
+    Returns
+    -------
+    recoded : Pandas series
+    """
+    value_codes, uniques = pd.factorize(series)
+    recoded_uniques = [codes.get(val, val) for val in uniques]
+    category_codes, categories = pd.factorize(np.array(recoded_uniques, dtype=object))
 
-def load_clinical_data(disease_code, recode_columns=True):
+    recoded_codes = np.full(len(value_codes), -1, dtype=np.intp)
+    present = value_codes >= 0
+    recoded_codes[present] = category_codes[value_codes[present]]
+
+    recoded = pd.Categorical.from_codes(recoded_codes, categories=categories)
+    if not categorical:
+        recoded = np.asarray(recoded, dtype=object)
+    return pd.Series(recoded, index=series.index, name=series.name)
+
+def recode_clinical_columns(clinical_df, data_dictionary=None, categorical=False):
+    """Recode every column of `clinical_df` found in the data dictionary
+
+    Parameters
+    ----------
+    clinical_df : Pandas dataframe
+    data_dictionary : dict, optional
+        Mapping of column name to a dict of codes, defaults to
+        `clinical_data_dictionary`
+    categorical : bool, optional
+        If True, recoded columns are returned as categoricals
+
+    Returns
+    -------
+    clinical_df : Pandas dataframe
+    """
+    if data_dictionary is None:
+        data_dictionary = clinical_data_dictionary
+
+    for column in clinical_df.columns.intersection(list(data_dictionary)):
+        clinical_df[column] = recode_series(clinical_df[column],
+                                            data_dictionary[column],
+                                            categorical=categorical)
+    return clinical_df
+
+def load_clinical_data(disease_code, recode_columns=True, categorical=False, max_age=None):
     """Downloads and loads the TCGA clinical data into a Pandas dataframe
 
     Parameters
     ----------
     disease_code : str
         TCGA disease type, i.e. 'LUAD', 'BLCA', 'BRCA' etc.
+    recode_columns : bool, optional
+        If True, replace coded values using `clinical_data_dictionary`
+    categorical : bool, optional
+        If True, recoded columns are returned as categoricals
+    max_age : int, optional
+        Seconds the downloaded files are considered fresh, see
+        `request_clinical_data`
 
     Returns
     -------
     patient_data_df : Dataframe
         Returns a Pandas dataframe with the patient data
     """
-    patient_data_path = request_clinical_data(disease_code, cache=True)
-
-    patient_data_df = load_tcga_tabfile(patient_data_path, skiprows=1)
-
-    if recode_columns:
-        for column in clinical_data_dictionary:
-            if column in patient_data_df.columns:
-                patient_data_df[column] = patient_data_df[column].map(
-                        lambda val: clinical_data_dictionary[column].get(val, val)
-                    )
+    patient_data_path = request_clinical_data(disease_code, cache=True, max_age=max_age)
+    if patient_data_path is None:
+        check_online('patient data for {}'.format(disease_code))
+        raise ValueError('No patient file found for {}'.format(disease_code))
+
+    def parse_patient_data():
+        # Read coded columns as strings so they match the data dictionary keys
+        patient_data_df = load_tcga_tabfile(patient_data_path,
+                                            skiprows=1,
+                                            dtype={column: str for column in clinical_data_dictionary})
+        if recode_columns:
+            recode_clinical_columns(patient_data_df, categorical=categorical)
+        return patient_data_df
+
+    patient_data_df = cached_table(os.path.dirname(patient_data_path),
+                                   PATIENT_DATA_FILE_CODE,
+                                   [patient_data_path],
+                                   parse_patient_data,
+                                   params={'recode_columns': recode_columns,
+                                           'categorical': categorical,
+                                           'data_dictionary': clinical_data_dictionary if recode_columns else None})
 
     logging.info("Loaded {} rows of clinical data from {} patients".format(
             len(patient_data_df),
@@ -103,29 +230,117 @@ def load_clinical_data(disease_code, recode_columns=True):
 
     return patient_data_df
 
+def index_patients(patient_barcodes, patient_data_df):
+    """Integer keys relating rows of another table to the clinical table
+
+    Parameters
+    ----------
+    patient_barcodes : Pandas series
+        Patient barcode of each row, e.g. the 'TCGA_ID' of mutations
+    patient_data_df : Pandas dataframe
+        Clinical data, as returned by `load_clinical_data`
+
+    Returns
+    -------
+    patient_index : numpy array
+        Position of each row's patient in `patients`, -1 if it has no barcode
+    patients : Pandas dataframe
+        The clinical data, one row per patient indexed by `patient_index`,
+        with a row holding only the barcode for patients missing from it
+    """
+    patients = patient_data_df.drop_duplicates('bcr_patient_barcode')
+    missing = pd.Index(patient_barcodes.dropna().unique()).difference(patients['bcr_patient_barcode'])
+    patients = pd.concat([patients, pd.DataFrame({'bcr_patient_barcode': missing})],
+                         ignore_index=True)
+    patients.index.name = 'patient_index'
+
+    patient_index = pd.Index(patients['bcr_patient_barcode']).get_indexer(patient_barcodes)
+    return patient_index.astype(np.int32), patients
+
 def find_clinical_files(search_tag, disease_code_dir):
     files = [f for f in os.listdir(disease_code_dir) if search_tag in f]
     return files
 
+# Biotab tables by type: the file code of their files and the number of
+# header rows to skip after the column names
+BIOTAB_TABLES = {
+    'sample': ('biospecimen_sample', 0),
+    'analyte': ('biospecimen_analyte', 0),
+    'aliquot': ('biospecimen_aliquot', 0),
+    'drug': ('clinical_drug', 1),
+}
+
+def _biotab_files(disease_code_dir, file_code):
+    """Paths of the cached files of a table, listed from the cache manifest
+    and falling back to the directory for caches without one"""
+    search_tag = '_{}_'.format(file_code)
+    file_names = [f for f in read_manifest(disease_code_dir) if search_tag in f]
+    if not file_names:
+        file_names = find_clinical_files(search_tag, disease_code_dir)
+    return [os.path.join(disease_code_dir, f)
+            for f in sorted(file_names)
+            if os.path.exists(os.path.join(disease_code_dir, f))]
+
+def request_biotab_files(disease_code, max_age=None):
+    """Make sure the clinical and biospecimen files of a cohort are cached,
+    whether or not it has a patient file
+
+    Returns
+    -------
+    disease_code_dir : str
+        Directory of the cohort's files
+    """
+    request_clinical_data(disease_code, cache=True, max_age=max_age)
+    return os.path.join(cache_data_dir(), disease_code)
+
+def _concat_tables(dfs):
+    if len(dfs) == 1:
+        return dfs[0]
+    return pd.concat(dfs, ignore_index=True)
+
+def load_biospecimen_table(disease_code, table_type, cache=True, max_age=None):
+    """Load a biospecimen or drug table, combining the files of all centers
+
+    Parameters
+    ----------
+    disease_code : str
+        TCGA disease type, i.e. 'LUAD', 'BLCA', 'BRCA' etc.
+    table_type : str
+        'sample', 'analyte', 'aliquot' or 'drug'
+    cache : bool, optional
+        Whether to use and update the cache of parsed tables
+    max_age : int, optional
+        Seconds the downloaded files are considered fresh, see
+        `request_clinical_data`
+
+    Returns
+    -------
+    table_df : Pandas dataframe
+        Rows of all files of the table
+    """
+    if table_type not in BIOTAB_TABLES:
+        raise ValueError('Unknown table type {!r}, expected one of {}'.format(
+            table_type, ', '.join(sorted(BIOTAB_TABLES))))
+    (file_code, skiprows) = BIOTAB_TABLES[table_type]
+
+    disease_code_dir = request_biotab_files(disease_code, max_age=max_age)
+    table_files = _biotab_files(disease_code_dir, file_code)
+    if not table_files:
+        check_online('{} files for {}'.format(file_code, disease_code))
+        raise ValueError('No {} files found for {}'.format(file_code, disease_code))
+
+    return cached_table(disease_code_dir, file_code, table_files,
+                        lambda: _concat_tables(load_tcga_tabfiles(table_files, skiprows=skiprows)),
+                        cache=cache)
+
 def _load_samples(disease_code, filter_vial=None):
-    disease_code_dir = os.path.join(cache_data_dir(), disease_code)
-    sample_files = find_clinical_files('_biospecimen_sample_', disease_code_dir)
-    sample_df = pd.concat(
-        [load_tcga_tabfile(os.path.join(disease_code_dir, f))
-            for f in sample_files],
-        copy=False)
+    sample_df = load_biospecimen_table(disease_code, 'sample')
     if filter_vial:
         sample_df = sample_df[sample_df.vial_number == filter_vial]
     return sample_df
 
 def _load_analytes(disease_code):
-    disease_code_dir = os.path.join(cache_data_dir(), disease_code)
-    analyte_files = find_clinical_files('_biospecimen_analyte_', disease_code_dir)
-    analyte_df = pd.concat(
-        [load_tcga_tabfile(os.path.join(disease_code_dir, f))
-            for f in analyte_files],
-        copy=False)
-    return analyte_df
+    return load_biospecimen_table(disease_code, 'analyte')
 
 def load_treatments(disease_code):
     """Load the treatment entries for each patient
@@ -140,14 +355,7 @@ def load_treatments(disease_code):
     treatment_df : Pandas dataframe
         Dataframe of treatment entries for each patient
     """
-    disease_code_dir = os.path.join(cache_data_dir(), disease_code)
-    treatment_files = find_clinical_files('_clinical_drug', disease_code_dir)
-
-    treatment_df = pd.concat(
-        [load_tcga_tabfile(os.path.join(disease_code_dir, f), skiprows=1)
-            for f in treatment_files],
-        copy=False)
-    return treatment_df
+    return load_biospecimen_table(disease_code, 'drug')
 
 def load_patient_samples(disease_code, recode_columns=True, filter_vial=None):
     """Load the samples taken per patient"""
@@ -170,12 +378,6 @@ def load_sample_and_analytes(disease_code, filter_vial=None):
 
     return samples.merge(analytes)
 
-def load_aliquots(disease_code, recode_columns=True):
+def load_aliquots(disease_code):
     """Load the aliqouts taken per patient"""
-    disease_code_dir = os.path.join(PYTCGA_BASE_DIRECTORY, disease_code)
-    aliquot_files = find_clinical_files('_biospecimen_aliquot_', disease_code_dir)
-    aliquot_df = pd.concat(
-        [load_tcga_tabfile(os.path.join(disease_code_dir, f))
-            for f in aliquot_files],
-        copy=False)
-    return aliquot_df
+    return load_biospecimen_table(disease_code, 'aliquot')
@@ -0,0 +1,162 @@
+from .tcga_clinical import load_clinical_data, load_biospecimen_table
+from .tcga_utils import TCGA_BARCODE_LEVELS, barcode_column, barcode_prefix
+from .tcga_barcode_index import load_barcode_index
+
+# Barcode level that identifies the rows of each table
+COHORT_TABLE_LEVELS = {
+    'patients': 'patient',
+    'samples': 'sample',
+    'analytes': 'analyte',
+    'aliquots': 'aliquot',
+    'drugs': 'patient',
+}
+
+# Biotab table type of each table other than patients
+COHORT_BIOTAB_TABLES = {
+    'samples': 'sample',
+    'analytes': 'analyte',
+    'aliquots': 'aliquot',
+    'drugs': 'drug',
+}
+
+class Cohort(object):
+    """Clinical and biospecimen tables of a single TCGA disease
+
+    Each table is loaded on first access and indexed by the barcode of its
+    level, e.g. samples by `bcr_sample_barcode`, with the barcodes of all
+    coarser levels added as columns so tables can be joined on explicit keys.
+
+    Parameters
+    ----------
+    disease_code : str
+        TCGA disease type, i.e. 'LUAD', 'BLCA', 'BRCA' etc.
+    recode_columns : bool, optional
+        If True, recode the patient table with `clinical_data_dictionary`
+    max_age : int, optional
+        Seconds the downloaded clinical files are considered fresh, see
+        `request_clinical_data`
+
+    Examples
+    --------
+    >>> luad = Cohort('LUAD')
+    >>> luad.join('analytes', 'samples', 'patients')
+    """
+    def __init__(self, disease_code, recode_columns=True, max_age=None):
+        self.disease_code = disease_code
+        self.recode_columns = recode_columns
+        self.max_age = max_age
+        self._tables = {}
+        self._barcode_index = None
+
+    def __repr__(self):
+        return 'Cohort({!r}, loaded={})'.format(self.disease_code, sorted(self._tables))
+
+    def _load_table(self, name):
+        if name == 'patients':
+            df = load_clinical_data(self.disease_code, self.recode_columns, max_age=self.max_age)
+        elif name in COHORT_BIOTAB_TABLES:
+            df = load_biospecimen_table(self.disease_code, COHORT_BIOTAB_TABLES[name],
+                                        max_age=self.max_age)
+        else:
+            raise ValueError('Unknown table {}, expected one of {}'.format(
+                name, sorted(COHORT_TABLE_LEVELS)))
+
+        level = COHORT_TABLE_LEVELS[name]
+        key = barcode_column(level)
+        for parent_level in TCGA_BARCODE_LEVELS[:TCGA_BARCODE_LEVELS.index(level)]:
+            parent_key = barcode_column(parent_level)
+            if parent_key not in df.columns:
+                df[parent_key] = barcode_prefix(df[key], parent_level).values
+
+        if name != 'drugs':
+            df = df.set_index(key)
+        return df
+
+    def table(self, name):
+        """Return the table `name`, loading it if needed"""
+        if name not in self._tables:
+            self._tables[name] = self._load_table(name)
+        return self._tables[name]
+
+    @property
+    def patients(self):
+        return self.table('patients')
+
+    @property
+    def samples(self):
+        return self.table('samples')
+
+    @property
+    def analytes(self):
+        return self.table('analytes')
+
+    @property
+    def aliquots(self):
+        return self.table('aliquots')
+
+    @property
+    def drugs(self):
+        return self.table('drugs')
+
+    @property
+    def barcode_index(self):
+        """`BarcodeIndex` of the cohort's biospecimens, loaded on first use"""
+        if self._barcode_index is None:
+            self._barcode_index = load_barcode_index(self.disease_code, max_age=self.max_age)
+        return self._barcode_index
+
+    def join(self, *names, **kwargs):
+        """Join tables on the barcode of the coarser level of each pair
+
+        The first table determines the rows, each following table is joined
+        on its index when it has one row per key, otherwise merged on the key
+        column. Columns already present are not repeated.
+
+        Parameters
+        ----------
+        names : str
+            Names of the tables to join, e.g. 'samples', 'patients'
+        how : str, optional
+            Type of join, 'left' by default
+        columns : dict, optional
+            Mapping from table name to the subset of its columns to include
+
+        Returns
+        -------
+        joined : Pandas dataframe
+        """
+        how = kwargs.pop('how', 'left')
+        columns = kwargs.pop('columns', {})
+        if kwargs:
+            raise TypeError('Unexpected arguments {}'.format(sorted(kwargs)))
+        if not names:
+            raise ValueError('At least one table name is required')
+
+        joined_level = COHORT_TABLE_LEVELS[names[0]]
+        joined = _reset_barcode_index(self._selected(names[0], columns))
+
+        for name in names[1:]:
+            level = COHORT_TABLE_LEVELS[name]
+            key_level = min(joined_level, level, key=TCGA_BARCODE_LEVELS.index)
+            key = barcode_column(key_level)
+
+            table = self._selected(name, columns)
+            if table.index.name == key and table.index.is_unique:
+                table = table.drop(columns=table.columns.intersection(joined.columns))
+                joined = joined.join(table, on=key, how=how)
+            else:
+                table = _reset_barcode_index(table)
+                table = table.drop(columns=table.columns.intersection(joined.columns).drop(key))
+                joined = joined.merge(table, on=key, how=how)
+                joined_level = max(joined_level, level, key=TCGA_BARCODE_LEVELS.index)
+
+        return joined
+
+    def _selected(self, name, columns):
+        table = self.table(name)
+        if name in columns:
+            table = table[list(columns[name])]
+        return table
+
+def _reset_barcode_index(table):
+    return table.reset_index(drop=table.index.name is None)
@@ -0,0 +1,249 @@
+import os
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+
+from .tcga_requests import cache_data_dir, RequestError
+from .tcga_mutations import load_mutation_data
+from .tcga_utils import load_studies
+from .instrumentation import span
+
+MUTATION_DATASET_DIRECTORY = 'mutation_dataset'
+DISEASE_PARTITION = 'disease'
+CHROMOSOME_PARTITION = 'Chromosome'
+# Partition value of mutations without a chromosome
+MISSING_PARTITION = '__missing__'
+# Rows per Parquet row group, the unit skipped by gene and position filters
+ROW_GROUP_SIZE = 64 * 1024
+
+def _require_pyarrow():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('The mutation dataset is stored as Parquet and requires pyarrow')
+    return pyarrow.parquet
+
+def mutation_dataset_dir():
+    return os.path.join(cache_data_dir(), MUTATION_DATASET_DIRECTORY)
+
+def normalize_chromosome(chromosome):
+    """Chromosome name without a 'chr' prefix, e.g. 'chr7' -> '7'"""
+    if isinstance(chromosome, float) and chromosome.is_integer():
+        chromosome = int(chromosome)
+    chromosome = str(chromosome)
+    if chromosome.lower().startswith('chr'):
+        chromosome = chromosome[3:]
+    return chromosome
+
+def _partition_dir(path, disease_code, chromosome=None):
+    disease_dir = os.path.join(path, '{}={}'.format(DISEASE_PARTITION, disease_code))
+    if chromosome is None:
+        return disease_dir
+    return os.path.join(disease_dir, '{}={}'.format(CHROMOSOME_PARTITION, chromosome))
+
+def _partition_values(path, partition):
+    prefix = partition + '='
+    if not os.path.isdir(path):
+        return []
+    return sorted(name[len(prefix):] for name in os.listdir(path)
+                  if name.startswith(prefix) and os.path.isdir(os.path.join(path, name)))
+
+def _arrow_compatible(df):
+    # Object columns of MAF files mix strings and numbers, e.g. dbSNP_RS,
+    # which Parquet columns can't hold
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].isnull(), df[column].astype(str))
+    return df
+
+def write_mutation_partitions(mutations, disease_code, path=None):
+    """Store the mutations of one cohort in the partitioned dataset
+
+    Mutations are written to one Parquet file per chromosome under
+    `<path>/disease=<code>/Chromosome=<chromosome>/`, sorted by position.
+    Partitions previously written for the cohort are replaced.
+
+    Parameters
+    ----------
+    mutations : Pandas dataframe
+        Mutations as returned by `load_mutation_data`
+    disease_code : str
+        TCGA disease code of the cohort
+    path : str, optional
+        Root directory of the dataset, by default in the pytcga cache
+
+    Returns
+    -------
+    disease_dir : str
+        Directory of the cohort's partitions
+    """
+    _require_pyarrow()
+    path = path or mutation_dataset_dir()
+    disease_code = disease_code.upper()
+    disease_dir = _partition_dir(path, disease_code)
+    tmp_dir = disease_dir + '.tmp-{}'.format(os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+    chromosomes = mutations['Chromosome'].map(normalize_chromosome, na_action='ignore') \
+                                         .fillna(MISSING_PARTITION)
+    mutations = _arrow_compatible(mutations.drop(columns=['Chromosome']))
+
+    with span('mutation_dataset.write', disease=disease_code) as write_span:
+        for (chromosome, partition) in mutations.groupby(chromosomes.values, sort=True):
+            partition_dir = os.path.join(tmp_dir, '{}={}'.format(CHROMOSOME_PARTITION, chromosome))
+            os.makedirs(partition_dir)
+            partition = partition.sort_values('Start_position', kind='mergesort')
+            partition.to_parquet(os.path.join(partition_dir, 'part-0.parquet'),
+                                 index=False,
+                                 row_group_size=ROW_GROUP_SIZE)
+            write_span.add(rows=len(partition), partitions=1)
+
+        if os.path.exists(disease_dir):
+            shutil.rmtree(disease_dir)
+        os.rename(tmp_dir, disease_dir)
+
+    return disease_dir
+
+def build_mutation_dataset(disease_codes=None, path=None, errors='skip', wait_time=30):
+    """Load the mutations of several cohorts into the partitioned dataset
+
+    Cohorts are loaded and written one at a time, so building the dataset
+    only holds a single cohort in memory.
+
+    Parameters
+    ----------
+    disease_codes : list of str, optional
+        TCGA disease codes, by default all studies from `load_studies`
+    path : str, optional
+        Root directory of the dataset, by default in the pytcga cache
+    errors : str, optional
+        'skip' to log a warning for cohorts without mutation data, 'raise'
+        to fail
+    wait_time : int, optional
+        Time to wait for response from TCGA
+
+    Returns
+    -------
+    disease_codes : list of str
+        Cohorts written to the dataset
+    """
+    if disease_codes is None:
+        disease_codes = load_studies()['Study Abbreviation'].tolist()
+
+    written = []
+    for disease_code in disease_codes:
+        try:
+            mutations = load_mutation_data(disease_code, wait_time=wait_time)
+        except RequestError as e:
+            if errors == 'raise':
+                raise
+            logging.warning('Skipping {}, no mutation data: {!r}'.format(disease_code, e))
+            continue
+        write_mutation_partitions(mutations, disease_code, path=path)
+        written.append(disease_code.upper())
+    return written
+
+def mutation_dataset_diseases(path=None):
+    """Disease codes stored in the mutation dataset"""
+    return _partition_values(path or mutation_dataset_dir(), DISEASE_PARTITION)
+
+def _parse_region(region):
+    if isinstance(region, str):
+        (chromosome, _, interval) = region.partition(':')
+        if interval:
+            (start, end) = interval.replace(',', '').split('-')
+            return (normalize_chromosome(chromosome), int(start), int(end))
+        return (normalize_chromosome(chromosome), None, None)
+    (chromosome, start, end) = region
+    return (normalize_chromosome(chromosome), start, end)
+
+def query_mutations(diseases=None,
+                    chromosomes=None,
+                    genes=None,
+                    region=None,
+                    columns=None,
+                    path=None):
+    """Read mutations from the partitioned dataset
+
+    Only the partitions of the requested diseases and chromosomes are
+    opened, only the requested columns are read and row groups are skipped
+    using their gene and position statistics.
+
+    Parameters
+    ----------
+    diseases : list of str, optional
+        TCGA disease codes, by default all cohorts in the dataset
+    chromosomes : list of str, optional
+        Chromosomes, with or without a 'chr' prefix
+    genes : list of str, optional
+        Hugo gene symbols
+    region : str or tuple, optional
+        Genomic interval, 'chr7:55086725-55275031' or ('7', 55086725, 55275031),
+        mutations starting within it are returned
+    columns : list of str, optional
+        Columns to read, by default all. 'disease' and 'Chromosome' are
+        always included.
+    path : str, optional
+        Root directory of the dataset, by default in the pytcga cache
+
+    Returns
+    -------
+    mutations : Pandas dataframe
+        Matching mutations with categorical 'disease' and 'Chromosome' columns
+    """
+    parquet = _require_pyarrow()
+    path = path or mutation_dataset_dir()
+
+    if diseases is None:
+        diseases = mutation_dataset_diseases(path)
+    diseases = [disease.upper() for disease in diseases]
+    if chromosomes is not None:
+        chromosomes = set(normalize_chromosome(chromosome) for chromosome in chromosomes)
+
+    filters = []
+    if genes is not None:
+        filters.append(('Hugo_Symbol', 'in', list(genes)))
+    if region is not None:
+        (region_chromosome, start, end) = _parse_region(region)
+        chromosomes = set([region_chromosome]) & chromosomes if chromosomes is not None \
+                      else set([region_chromosome])
+        if start is not None:
+            filters.append(('Start_position', '>=', start))
+        if end is not None:
+            filters.append(('Start_position', '<=', end))
+
+    if columns is not None:
+        columns = [column for column in columns
+                   if column not in (DISEASE_PARTITION, CHROMOSOME_PARTITION)]
+
+    frames = []
+    with span('mutation_dataset.query') as query_span:
+        for disease in diseases:
+            disease_dir = _partition_dir(path, disease)
+            for chromosome in _partition_values(disease_dir, CHROMOSOME_PARTITION):
+                if chromosomes is not None and chromosome not in chromosomes:
+                    continue
+                partition_dir = _partition_dir(path, disease, chromosome)
+                for file_name in sorted(os.listdir(partition_dir)):
+                    table = parquet.read_table(os.path.join(partition_dir, file_name),
+                                               columns=columns,
+                                               filters=filters or None)
+                    query_span.add(files=1, rows=table.num_rows)
+                    if table.num_rows:
+                        frames.append((disease, chromosome, table.to_pandas()))
+
+    if not frames:
+        result = pd.DataFrame(columns=columns or [])
+        result[DISEASE_PARTITION] = pd.Categorical([], categories=diseases)
+        result[CHROMOSOME_PARTITION] = pd.Categorical([])
+        return result
+
+    lengths = [len(frame) for (_, _, frame) in frames]
+    result = pd.concat([frame for (_, _, frame) in frames], ignore_index=True, sort=False)
+    result[DISEASE_PARTITION] = pd.Categorical(
+        np.repeat([disease for (disease, _, _) in frames], lengths), categories=diseases)
+    result[CHROMOSOME_PARTITION] = pd.Categorical(
+        np.repeat([chromosome for (_, chromosome, _) in frames], lengths))
+    return result
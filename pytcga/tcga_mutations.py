@@ -1,18 +1,26 @@
 import os
 import logging
-import tarfile
 import pandas as pd
 
-from pytcga.tcga_requests import tcga_request, RequestError
-from pytcga.tcga_clinical import load_clinical_data
+from pytcga.tcga_requests import tcga_request, cache_data_dir, RequestError, OfflineError
+from pytcga.tcga_clinical import load_clinical_data, index_patients
+from pytcga.instrumentation import span
 
 # A list of designated sequencing centers for TCGA.
 # All studies have data produced by one of the following centers
 sequencing_centers = ['BI', 'BCM', 'WUSM']
 
+def _is_maf_file(file_name):
+    return file_name.endswith('.maf')
+
 def prefetch_mutation_data(disease_code,
                           wait_time=30,
-                          cache=True):
+                          cache=True,
+                          extract_to=None,
+                          on_extract=None):
+    # In offline mode a center without a cached archive is not a reason to
+    # stop, the data may be cached from the next one
+    missing = []
     for center in sequencing_centers:
         try:
             archive_path = tcga_request(disease=disease_code,
@@ -21,18 +29,42 @@ def prefetch_mutation_data(disease_code,
                                        platformType='Somatic Mutations',
                                        platform='Automated Mutation Calling',
                                        wait_time=wait_time,
-                                       cache=cache)
+                                       cache=cache,
+                                       extract_to=extract_to,
+                                       member_filter=_is_maf_file,
+                                       on_extract=on_extract)
             break
+        except OfflineError as e:
+            missing.extend(e.missing)
         except RequestError:
             logging.debug('For {}, center {} has no mutation data.'.format(
                 disease_code, center))
+    else:
+        if missing:
+            raise OfflineError(missing)
+        raise RequestError('204', 'No mutation data for {} from centers {}'.format(
+            disease_code, ', '.join(sequencing_centers)))
 
     return archive_path
 
+def _mutation_result_dir(disease_code):
+    return os.path.join(cache_data_dir(), disease_code, 'mutations')
+
+def _extract_mutation_archive(disease_code, wait_time=30, on_extract=None):
+    # MAF files are extracted while the archive downloads
+    result_dir = _mutation_result_dir(disease_code)
+    prefetch_mutation_data(disease_code,
+                           wait_time=wait_time,
+                           cache=True,
+                           extract_to=result_dir,
+                           on_extract=on_extract)
+    return result_dir
+
 def load_mutation_data(disease_code,
                        with_clinical=False,
                        variant_type='all',
-                       wait_time=30):
+                       wait_time=30,
+                       patient_table=False):
     """Load variants from TCGA
 
     Parameters
@@ -45,40 +77,47 @@ def load_mutation_data(disease_code,
         Filter to a specific variant type 'SNP', 'INDEL'
     wait_time : int, optional
         Time to wait for response from TCGA
+    patient_table : bool, optional
+        If True, return the mutations keyed by an integer `patient_index`
+        along with the clinical data indexed by `patient_index` instead of
+        merging them, see `attach_columns` for a wide join
 
     Returns
     -------
     mutations : Pandas dataframe
         A dataframe of mutations
+    patients : Pandas dataframe
+        Only if `patient_table` is True, the clinical data indexed by
+        `patient_index`
     """
-    archive_path = prefetch_mutation_data(disease_code,
-                                      wait_time=wait_time,
-                                      cache=True)
+    def read_maf(path):
+        return pd.read_csv(path, sep='\t', na_values='[Not Available]')
 
-    # Unpack tar file
-    archive = tarfile.open(archive_path)
+    # MAF files of a downloading archive are parsed as soon as they are extracted
+    streamed = {}
+    def parse_extracted(path):
+        streamed[os.path.basename(path)] = read_maf(path)
 
-    result_dir = os.path.join(os.path.dirname(archive_path), disease_code, 'mutations')
-    if not os.path.exists(result_dir):
-        os.makedirs(result_dir)
+    result_dir = _extract_mutation_archive(disease_code,
+                                           wait_time=wait_time,
+                                           on_extract=parse_extracted)
 
-    archive.extractall(path=result_dir)
+    maf_files = sorted(f
+                       for f in os.listdir(result_dir)
+                       if _is_maf_file(f))
 
-    # Filter to MAF files
-    maf_files = [f
-                  for f in os.listdir(result_dir)
-                  if f.endswith('.maf')]
-
-    mutation_df = pd.concat([pd.read_csv(os.path.join(result_dir, maf_file),
-                                    sep='\t',
-                                    na_values='[Not Available]')
-                    for maf_file in maf_files], copy=False)
+    with span('mutations.parse', files=len(maf_files), streamed=len(streamed)) as parse_span:
+        mutation_df = pd.concat([streamed.pop(maf_file) if maf_file in streamed
+                                 else read_maf(os.path.join(result_dir, maf_file))
+                                 for maf_file in maf_files], ignore_index=True)
+        parse_span.add(rows=len(mutation_df))
 
     # Expand out the TCGA barcode to retrieve the TCGA ID
-    tcga_info = mutation_df['Tumor_Sample_Barcode'].str.rsplit('-', n=4, expand=True)
-    tcga_info.columns = ['TCGA_ID', 'SampleID', 'PortionID', 'PlateID', 'CenterID']
+    with span('mutations.split_barcodes'):
+        tcga_info = mutation_df['Tumor_Sample_Barcode'].str.rsplit('-', n=4, expand=True)
+        tcga_info.columns = ['TCGA_ID', 'SampleID', 'PortionID', 'PlateID', 'CenterID']
 
-    mutations = mutation_df.join(tcga_info, how='left')
+        mutations = mutation_df.join(tcga_info, how='left')
 
     if variant_type != 'all':
         if variant_type == 'indel':
@@ -96,12 +135,21 @@ def load_mutation_data(disease_code,
                 )
     )
 
+    if patient_table:
+        patient_data_df = load_clinical_data(disease_code)
+        with span('mutations.index_patients'):
+            (patient_index, patients) = index_patients(mutations['TCGA_ID'], patient_data_df)
+            mutations = mutations.assign(patient_index=patient_index)
+        return mutations, patients
+
     if with_clinical:
         patient_data_df = load_clinical_data(disease_code)
-        merged = mutations.merge(patient_data_df,
-                            how='outer',
-                            left_on='TCGA_ID',
-                            right_on='bcr_patient_barcode')
+        with span('mutations.merge_clinical') as merge_span:
+            merged = mutations.merge(patient_data_df,
+                                how='outer',
+                                left_on='TCGA_ID',
+                                right_on='bcr_patient_barcode')
+            merge_span.add(rows=len(merged))
 
         logging.info("Patients: {}, Tumor Samples: {}, Mutations {}".format(
                     merged['bcr_patient_barcode'].nunique(),
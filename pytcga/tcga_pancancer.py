@@ -0,0 +1,200 @@
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import pandas as pd
+
+from . import tcga_requests
+from .tcga_requests import OfflineError, is_offline, set_offline
+from .tcga_clinical import request_clinical_data, load_clinical_data
+from .tcga_mutations import prefetch_mutation_data, load_mutation_data
+from .tcga_rna import prefetch_rnaseq_data, load_rnaseq_data
+from .tcga_utils import load_studies
+from .instrumentation import span
+
+# Number of cohorts downloaded at the same time
+NETWORK_WORKERS = 4
+
+def _prefetch_clinical_data(disease_code, wait_time=30):
+    return request_clinical_data(disease_code, cache=True)
+
+# For each data type, the function downloading a cohort into the cache and
+# the function loading it from there
+PANCANCER_DATA_TYPES = {
+    'mutation': (prefetch_mutation_data, load_mutation_data),
+    'clinical': (_prefetch_clinical_data, load_clinical_data),
+    'rnaseq': (prefetch_rnaseq_data, load_rnaseq_data),
+}
+
+# Parse workers are started from a fresh process rather than forked, a fork
+# could copy a lock held by a download thread, e.g. the manifest lock. There
+# is no fork server on Windows.
+PARSE_START_METHOD = ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                      else 'spawn')
+
+def _init_parse_worker(offline, base_directory):
+    # Workers don't inherit the settings made in the parent at runtime
+    set_offline(offline)
+    tcga_requests.PYTCGA_BASE_DIRECTORY = base_directory
+
+def _load_cohort(loader, disease_code, kwargs):
+    return loader(disease_code, **kwargs)
+
+def load_pancancer_data(data_type,
+                        disease_codes=None,
+                        combine=True,
+                        errors='raise',
+                        network_workers=NETWORK_WORKERS,
+                        parse_workers=0,
+                        wait_time=30,
+                        **kwargs):
+    """Load one type of data for several TCGA cohorts in parallel
+
+    Cohorts are downloaded by a pool of threads and each is handed to a pool
+    of processes for parsing as soon as its download finishes, so parsing
+    one cohort overlaps with downloading the next.
+
+    Parameters
+    ----------
+    data_type : str
+        'mutation', 'clinical' or 'rnaseq'
+    disease_codes : list of str, optional
+        TCGA disease codes, by default all studies from `load_studies`
+    combine : bool, optional
+        If True, concatenate the cohorts into one dataframe with a
+        categorical 'disease' column, otherwise return a dict of the result
+        of each cohort by disease code
+    errors : str, optional
+        'raise' to fail on the first cohort that can't be loaded, 'skip' to
+        log a warning and leave it out, e.g. for cohorts without the data type.
+        In offline mode every cohort is checked before raising an
+        OfflineError listing all the data missing from the cache.
+    network_workers : int, optional
+        Number of cohorts downloaded at the same time
+    parse_workers : int, optional
+        Number of processes parsing cohorts, by default 0 and the cohorts are
+        parsed in this process. The processes are started fresh and import
+        the main module, a script using them must call this function under
+        `if __name__ == '__main__':`.
+    wait_time : int, optional
+        Time to wait for response from TCGA
+    kwargs : optional
+        Passed to the loader of the data type, e.g. `with_clinical=True`
+
+    Returns
+    -------
+    data : Pandas dataframe or dict
+        Dataframe of all cohorts if `combine`, otherwise a dict by disease
+        code in the order of `disease_codes`
+    """
+    if data_type not in PANCANCER_DATA_TYPES:
+        raise ValueError('Unknown data type {!r}, expected one of {}'.format(
+            data_type, ', '.join(sorted(PANCANCER_DATA_TYPES))))
+    if errors not in ('raise', 'skip'):
+        raise ValueError("errors must be 'raise' or 'skip', not {!r}".format(errors))
+
+    (prefetch, loader) = PANCANCER_DATA_TYPES[data_type]
+    if disease_codes is None:
+        disease_codes = load_studies()['Study Abbreviation'].tolist()
+    disease_codes = [code.upper() for code in disease_codes]
+
+    if parse_workers == 0:
+        parse_pool = None
+    else:
+        parse_pool = ProcessPoolExecutor(max_workers=parse_workers,
+                                         mp_context=multiprocessing.get_context(PARSE_START_METHOD),
+                                         initializer=_init_parse_worker,
+                                         initargs=(is_offline(), tcga_requests.PYTCGA_BASE_DIRECTORY))
+
+    results = {}
+    missing = {}
+
+    def failed(code, error):
+        if isinstance(error, OfflineError) and errors == 'raise':
+            missing[code] = error.missing
+        else:
+            _cohort_failed(code, error, errors)
+
+    with span('pancancer.load', data_type=data_type, cohorts=len(disease_codes)) as load_span:
+        network_pool = ThreadPoolExecutor(max_workers=network_workers)
+        try:
+            downloads = dict((network_pool.submit(prefetch, code, wait_time=wait_time), code)
+                             for code in disease_codes)
+
+            loads = []
+            for download in as_completed(downloads):
+                code = downloads[download]
+                try:
+                    download.result()
+                except Exception as e:
+                    failed(code, e)
+                    continue
+                if missing:
+                    # The call fails anyway, don't parse
+                    continue
+                if parse_pool is None:
+                    try:
+                        results[code] = _load_cohort(loader, code, kwargs)
+                    except Exception as e:
+                        failed(code, e)
+                else:
+                    loads.append((code, parse_pool.submit(_load_cohort, loader, code, kwargs)))
+
+            for (code, load) in loads:
+                try:
+                    results[code] = load.result()
+                except Exception as e:
+                    failed(code, e)
+        except BaseException:
+            # Don't start the cohorts still queued when the call fails
+            network_pool.shutdown(wait=False, cancel_futures=True)
+            if parse_pool is not None:
+                parse_pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        network_pool.shutdown(wait=True)
+        if parse_pool is not None:
+            parse_pool.shutdown(wait=True)
+        load_span.set(loaded=len(results))
+
+    if missing:
+        raise OfflineError([artifact for code in disease_codes
+                            for artifact in missing.get(code, [])])
+
+    results = dict((code, results[code]) for code in disease_codes if code in results)
+
+    if not combine:
+        return results
+    return combine_cohorts(results)
+
+def _cohort_failed(disease_code, error, errors):
+    if errors == 'raise':
+        raise error
+    logging.warning('Skipping {}, unable to load it: {!r}'.format(disease_code, error))
+
+def combine_cohorts(cohorts):
+    """Concatenate dataframes of several cohorts
+
+    Parameters
+    ----------
+    cohorts : dict
+        Dataframe of each cohort by disease code
+
+    Returns
+    -------
+    combined : Pandas dataframe
+        Rows of all cohorts, in order, with a categorical 'disease' column
+    """
+    for (code, cohort) in cohorts.items():
+        if not isinstance(cohort, pd.DataFrame):
+            raise ValueError('Cohort {} is a {}, not a dataframe, load it with combine=False'.format(
+                code, type(cohort).__name__))
+
+    codes = list(cohorts)
+    if not codes:
+        return pd.DataFrame({'disease': pd.Categorical([])})
+
+    combined = pd.concat([cohorts[code] for code in codes], ignore_index=True, sort=False)
+    combined['disease'] = pd.Categorical.from_codes(
+        np.repeat(np.arange(len(codes)), [len(cohorts[code]) for code in codes]),
+        categories=codes)
+    return combined
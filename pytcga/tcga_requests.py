@@ -10,11 +10,66 @@ import time
 import os
 import hashlib
 import json
+import tempfile
 
 from appdirs import user_data_dir
 
+from .instrumentation import span
+from .progress import ProgressTracker, get_progress_handler
+from .tcga_cache import (CHECKSUM_ALGORITHM,
+                         checksum_record,
+                         update_manifest,
+                         verify_cached_file)
+from .tcga_archive import StreamingExtractor, extract_archive, mark_extracted
+
 PYTCGA_BASE_DIRECTORY = user_data_dir("pytcga", version="0.1")
 
+# Bounds of the adaptive download block size. The block size doubles while
+# blocks arrive faster than FAST_BLOCK_SECONDS and halves when they take
+# longer than SLOW_BLOCK_SECONDS, so fast transfers use few large reads and
+# slow ones still report progress regularly.
+MIN_BLOCK_SIZE = 256 * 1024
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
+FAST_BLOCK_SECONDS = 0.05
+SLOW_BLOCK_SECONDS = 0.5
+
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+# Seconds to wait for a connection and between bytes of a response
+NETWORK_TIMEOUT = (10, 300)
+
+# Environment variable enabling offline mode, e.g. PYTCGA_OFFLINE=1
+OFFLINE_ENV_VAR = 'PYTCGA_OFFLINE'
+
+_offline = [None]
+
+class OfflineError(IOError):
+    """Raised in offline mode for data that is not in the cache
+
+    Attributes
+    ----------
+    missing : list of str
+        Descriptions of the missing artifacts
+    """
+    def __init__(self, missing):
+        self.missing = list(missing)
+        IOError.__init__(self, 'Offline mode, not in the cache: {}'.format('; '.join(self.missing)))
+
+def set_offline(offline=True):
+    """Only use cached data and never access the network. None reverts to
+    the PYTCGA_OFFLINE environment variable."""
+    _offline[0] = offline
+
+def is_offline():
+    if _offline[0] is not None:
+        return _offline[0]
+    return os.environ.get(OFFLINE_ENV_VAR, '').lower() not in ('', '0', 'false', 'no')
+
+def check_online(artifact):
+    """Raise OfflineError for `artifact` in offline mode"""
+    if is_offline():
+        raise OfflineError([artifact])
+
 def cache_data_dir():
     if not os.path.exists(PYTCGA_BASE_DIRECTORY):
         os.makedirs(PYTCGA_BASE_DIRECTORY)
@@ -34,8 +89,49 @@ def tcga_request(disease,
                   consolidateFiles='true',
                   flattenDir='true',
                   cache=True,
-                  wait_time=30):
+                  wait_time=30,
+                  progress=None,
+                  verify='fast',
+                  extract_to=None,
+                  member_filter=None,
+                  on_extract=None):
+    """Request an archive of TCGA data and download it into the cache
+
+    In offline mode, see `set_offline`, only a cached archive is returned
+    and OfflineError is raised if there is none.
+
+    Parameters
+    ----------
+    disease : str
+        TCGA disease code {'LUAD', 'BRCA', 'BLAC',...}
+    center, level, platform, platformType, sample_list : str, optional
+        Filters of the data request, see `create_tcga_filter_request`
+    cache : bool, optional
+        Reuse a previously downloaded archive for the same request
+    wait_time : int, optional
+        Wait-time (in seconds) between polls of the request status
+    progress : callable, optional
+        Called with a `DownloadProgress` while the archive downloads
+    verify : str, optional
+        How a cached archive is checked against the checksum recorded when
+        it was downloaded: 'fast' compares its size and modification time,
+        'full' hashes its contents and None skips the check. Archives that
+        fail the check are downloaded again.
+    extract_to : str, optional
+        Directory to extract the archive into. A downloaded archive is
+        extracted while it arrives, a cached one unless it already was.
+    member_filter : callable, optional
+        Called with the file name of each member, only members for which it
+        returns True are extracted
+    on_extract : callable, optional
+        Called with the path of each member as it is extracted, possibly
+        from another thread. Not called for an archive extracted earlier.
 
+    Returns
+    -------
+    archive_path : str
+        Path to the downloaded archive
+    """
     # All disease codes must be upper-case.
     disease = disease.upper()
 
@@ -59,18 +155,43 @@ def tcga_request(disease,
     # Create an output tar file with that ID
     output_file_name = request_id + '.tar'
 
-    # If using the cache, check if the file already exists
-    if cache:
-        archive_path = os.path.join(cache_data_dir(), output_file_name)
-
-        if os.path.exists(archive_path):
-            return archive_path
-
-    (ticket_id, status_url) = create_tcga_request(filter_parameters)
-    return check_and_retrieve_archive(
-                                status_url,
-                                archive_file_name=output_file_name,
-                                wait_time=wait_time)
+    with span('tcga_request', disease=disease, platform=platform) as request_span:
+        # If using the cache, check if the file already exists
+        if cache or is_offline():
+            archive_path = os.path.join(cache_data_dir(), output_file_name)
+
+            if os.path.exists(archive_path):
+                valid = None
+                if verify:
+                    with span('verify', full=verify == 'full'):
+                        valid = verify_cached_file(archive_path, full=verify == 'full')
+                if valid is False and is_offline():
+                    raise OfflineError(['{} (does not match its checksum)'.format(archive_path)])
+                if valid is False:
+                    logging.warning('Cached archive {} does not match its checksum, '
+                                    'downloading it again'.format(archive_path))
+                    os.remove(archive_path)
+                else:
+                    request_span.set(cache='hit')
+                    if extract_to is not None:
+                        extract_archive(archive_path, extract_to, member_filter, on_extract)
+                    return archive_path
+
+        request_span.set(cache='miss')
+        check_online('{} archive for {} ({})'.format(
+            platformType or platform, disease, ', '.join(
+                '{}={}'.format(key, value) for (key, value) in sorted(filter_parameters.items())
+                if value is not None and key not in ('disease', 'flattenDir', 'consolidateFiles'))))
+        (ticket_id, status_url, estimated_size) = _submit_tcga_request(filter_parameters)
+        return check_and_retrieve_archive(
+                                    status_url,
+                                    archive_file_name=output_file_name,
+                                    wait_time=wait_time,
+                                    progress=progress,
+                                    estimated_size=estimated_size,
+                                    extract_to=extract_to,
+                                    member_filter=member_filter,
+                                    on_extract=on_extract)
 
 
 def create_tcga_filter_request(disease,
@@ -151,7 +272,27 @@ def create_tcga_request(filter_parameters):
     (ticket_id, status_url) : (str, str)
         A pair of the ticket_id created and status url
     """
-    response = requests.get(REQUEST_ADDRESS, params=filter_parameters)
+    return _submit_tcga_request(filter_parameters)[:2]
+
+def parse_size(size):
+    """Parse a size such as 1024, '1024' or '1.5 MB' into bytes, None if it
+    can't be parsed"""
+    if isinstance(size, (int, float)):
+        return int(size)
+    try:
+        parts = str(size).strip().upper().split()
+        value = float(parts[0])
+        unit = parts[1] if len(parts) > 1 else 'B'
+        return int(value * SIZE_UNITS[unit])
+    except (ValueError, IndexError, KeyError):
+        return None
+
+def _submit_tcga_request(filter_parameters):
+    """Submit a data request, returns (ticket_id, status_url, estimated_size)
+    with the estimated size in bytes or None"""
+    check_online('data request {}'.format(filter_parameters))
+    with span('submit'):
+        response = requests.get(REQUEST_ADDRESS, params=filter_parameters, timeout=NETWORK_TIMEOUT)
 
     logging.debug("Request has status code {}".format(response.status_code))
 
@@ -192,7 +333,7 @@ def create_tcga_request(filter_parameters):
     else:
         raise ValueError('Request {} failed, \n{}'.format(response.url, response.text))
 
-    return (ticket_id, status_url)
+    return (ticket_id, status_url, parse_size(estimated_size))
 
 def retrieve_ticket_status(status_url):
     """Extract the current status at the tracking/status url
@@ -207,15 +348,79 @@ def retrieve_ticket_status(status_url):
     job_status : str
         Current status {'OK', 'Accepted', ...}
     """
-    tracking_response = requests.get(status_url)
-    tracking_response_parsed = tracking_response.json()
-    job_status = tracking_response_parsed['job-status']
+    check_online(status_url)
+    with span('poll') as poll_span:
+        tracking_response = requests.get(status_url, timeout=NETWORK_TIMEOUT)
+        tracking_response_parsed = tracking_response.json()
+        job_status = tracking_response_parsed['job-status']
+        poll_span.set(status=job_status.get('status-message'))
 
     return job_status
 
+def _iter_adaptive_blocks(response):
+    """Read the body of a streamed response in blocks sized to the measured
+    throughput"""
+    block_size = MIN_BLOCK_SIZE
+    while True:
+        start = time.time()
+        block = response.raw.read(block_size, decode_content=True)
+        if not block:
+            break
+        yield block
+
+        seconds = time.time() - start
+        if seconds < FAST_BLOCK_SECONDS and block_size < MAX_BLOCK_SIZE:
+            block_size *= 2
+        elif seconds > SLOW_BLOCK_SECONDS and block_size > MIN_BLOCK_SIZE:
+            block_size //= 2
+
+def _preallocate(output_file, size):
+    try:
+        os.posix_fallocate(output_file.fileno(), 0, size)
+    except (AttributeError, OSError, ValueError):
+        pass
+
+def _write_response(response, output_file, block_size, download_span,
+                    progress=None, total_size=None, tee=None):
+    """Stream the body of `response` into `output_file`, reporting progress
+    and hashing the blocks as they are written
+
+    With a `block_size` of None the block size adapts to the throughput.
+    Blocks are also written to `tee` if given. Returns the hex digest of the body.
+    """
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None:
+        total_size = int(content_length)
+        if 'Content-Encoding' not in response.headers:
+            _preallocate(output_file, total_size)
+
+    if block_size is None:
+        blocks = _iter_adaptive_blocks(response)
+    else:
+        blocks = response.iter_content(block_size)
+
+    hasher = hashlib.new(CHECKSUM_ALGORITHM)
+    tracker = ProgressTracker(progress or get_progress_handler(), response.url, total_size)
+    for block in blocks:
+        output_file.write(block)
+        if tee is not None:
+            tee.write(block)
+        hasher.update(block)
+        download_span.add(bytes=len(block))
+        tracker.update(len(block))
+    # Drop any preallocated space the response didn't fill
+    output_file.truncate()
+    tracker.finish()
+    return hasher.hexdigest()
+
 def retrieve_archive(archive_url,
                     output_file_name,
-                    block_size=1024):
+                    block_size=None,
+                    progress=None,
+                    total_size=None,
+                    extract_to=None,
+                    member_filter=None,
+                    on_extract=None):
     """Download the archive from given URL into the output file
 
     Parameters
@@ -224,6 +429,22 @@ def retrieve_archive(archive_url,
         TCGA URL to the created archive
     output_file_name : str
         Filename to save the archive
+    block_size : int, optional
+        Block size for the download, by default adapted to the throughput
+    progress : callable, optional
+        Called with a `DownloadProgress` as the download proceeds, defaults
+        to the handler set with `set_progress_handler`
+    total_size : int, optional
+        Expected size in bytes, used if the response has no Content-Length
+    extract_to : str, optional
+        Directory to extract the archive into as it downloads, the archive
+        is extracted after the download if streaming extraction fails
+    member_filter : callable, optional
+        Called with the file name of each member, only members for which it
+        returns True are extracted
+    on_extract : callable, optional
+        Called with the path of each member as it is extracted, from the
+        extraction thread while streaming
 
     Returns
     -------
@@ -233,17 +454,109 @@ def retrieve_archive(archive_url,
     archive_path = os.path.join(cache_data_dir(), output_file_name)
     logging.info('Saving request to {}'.format(archive_path))
 
-    with open(archive_path, 'wb') as archive:
-        archive_response = requests.get(archive_url, stream=True)
-
-        for block in archive_response.iter_content(block_size):
-            archive.write(block)
+    extractor = None
+    if extract_to is not None:
+        extractor = StreamingExtractor(extract_to, member_filter, on_extract).start()
+    try:
+        record = download_file(archive_url, archive_path,
+                               block_size=block_size,
+                               progress=progress,
+                               total_size=total_size,
+                               tee=extractor)
+    finally:
+        streamed = extractor is not None and extractor.finish()
+    record['fetched_at'] = time.time()
+    update_manifest(cache_data_dir(), {output_file_name: record})
+
+    if streamed:
+        mark_extracted(archive_path, extract_to)
+    elif extract_to is not None:
+        extract_archive(archive_path, extract_to, member_filter, on_extract)
 
     return archive_path
 
+def download_file(url,
+                  output_path,
+                  block_size=None,
+                  validators=None,
+                  progress=None,
+                  total_size=None,
+                  tee=None):
+    """Download `url` into `output_path`, revalidating a cached copy
+
+    If `validators` from a previous download are given, the request is made
+    conditional with If-None-Match / If-Modified-Since and the file is left
+    untouched when the server reports it has not changed.
+
+    Parameters
+    ----------
+    url : str
+    output_path : str
+        File to save the response to
+    block_size : int, optional
+        Block size for the download, by default adapted to the throughput
+    validators : dict, optional
+        'etag' and 'last_modified' values recorded for the cached copy
+    progress : callable, optional
+        Called with a `DownloadProgress` as the download proceeds, defaults
+        to the handler set with `set_progress_handler`
+    total_size : int, optional
+        Expected size in bytes, used if the response has no Content-Length
+    tee : file-like, optional
+        Also written each block of the response as it arrives
+
+    Returns
+    -------
+    record : dict
+        'etag' and 'last_modified' of the response, and the 'checksum',
+        'algorithm', 'size' and 'mtime' of the file, None if not modified
+    """
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    check_online(url)
+    with span('download', url=url) as download_span:
+        response = requests.get(url, stream=True, headers=headers, timeout=NETWORK_TIMEOUT)
+        if response.status_code == 304:
+            logging.debug('{} has not been modified'.format(url))
+            download_span.set(cache='hit')
+            return None
+        response.raise_for_status()
+        if validators:
+            download_span.set(cache='miss')
+
+        # Download next to the output so a failed transfer never replaces it
+        (handle, tmp_path) = tempfile.mkstemp(prefix='.download-',
+                                              dir=os.path.dirname(output_path))
+        try:
+            with os.fdopen(handle, 'wb') as output_file:
+                checksum = _write_response(response, output_file, block_size, download_span,
+                                           progress=progress,
+                                           total_size=total_size,
+                                           tee=tee)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    record = checksum_record(output_path, checksum)
+    record.update({'etag': response.headers.get('ETag'),
+                   'last_modified': response.headers.get('Last-Modified')})
+    return record
+
 def check_and_retrieve_archive(status_url,
                                archive_file_name,
-                               wait_time=None):
+                               wait_time=None,
+                               progress=None,
+                               estimated_size=None,
+                               extract_to=None,
+                               member_filter=None,
+                               on_extract=None):
     """Checks the status URL from TCGA and attempts to download the archive
 
     Returns None if no archive exists and did not re-poll
@@ -256,6 +569,17 @@ def check_and_retrieve_archive(status_url,
         File name for archive from TCGA data request
     wait_time : int, optional
         Wait-time (in seconds) before polling service for data
+    progress : callable, optional
+        Called with a `DownloadProgress` while the archive downloads
+    estimated_size : int, optional
+        Estimated archive size in bytes reported when the request was made
+    extract_to : str, optional
+        Directory to extract the archive into while it downloads
+    member_filter : callable, optional
+        Called with the file name of each member, only members for which it
+        returns True are extracted
+    on_extract : callable, optional
+        Called with the path of each member as it is extracted
 
     Returns
     -------
@@ -266,7 +590,12 @@ def check_and_retrieve_archive(status_url,
     job_status = retrieve_ticket_status(status_url)
     if job_status['status-message'] == 'OK':
         archive_url = job_status['archive-url']
-        return retrieve_archive(archive_url, archive_file_name)
+        return retrieve_archive(archive_url, archive_file_name,
+                                progress=progress,
+                                total_size=estimated_size,
+                                extract_to=extract_to,
+                                member_filter=member_filter,
+                                on_extract=on_extract)
 
     if wait_time:
         while(True):
@@ -275,7 +604,12 @@ def check_and_retrieve_archive(status_url,
 
             if job_status['status-message'] == 'OK':
                 archive_url = job_status['archive-url']
-                archive_path = retrieve_archive(archive_url, archive_file_name)
+                archive_path = retrieve_archive(archive_url, archive_file_name,
+                                                progress=progress,
+                                                total_size=estimated_size,
+                                                extract_to=extract_to,
+                                                member_filter=member_filter,
+                                                on_extract=on_extract)
                 return archive_path
 
     return None
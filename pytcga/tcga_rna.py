@@ -1,69 +1,434 @@
 import os
 import tarfile
+import numpy as np
 import pandas as pd
 
-from pytcga.tcga_requests import tcga_request
-from pytcga.tcga_clinical import load_clinical_data
+from pytcga.tcga_requests import tcga_request, cache_data_dir
+from pytcga.tcga_clinical import load_clinical_data, index_patients
+from pytcga.tcga_utils import attach_columns
+from pytcga.tcga_archive import is_extracted
+from pytcga.instrumentation import span
+
+GENE_QUANTIFICATION_FILE_CODE = 'genes.normalized_results'
+FILE_SAMPLE_MAP_FILE = 'FILE_SAMPLE_MAP.txt'
+
+def _is_rnaseq_file(file_name):
+    return GENE_QUANTIFICATION_FILE_CODE in file_name or file_name == FILE_SAMPLE_MAP_FILE
 
 def prefetch_rnaseq_data(disease_code,
                         wait_time=30,
-                        cache=True,):
+                        cache=True,
+                        extract_to=None,
+                        on_extract=None):
 
     archive_path = tcga_request(disease=disease_code,
                                level='3',
                                center='7',
                                platformType='RNASeqV2',
                                platform='IlluminaHiSeq_RNASeqV2',
-                               wait_time=30)
+                               wait_time=wait_time,
+                               cache=cache,
+                               extract_to=extract_to,
+                               member_filter=_is_rnaseq_file,
+                               on_extract=on_extract)
 
     return archive_path
 
+def _rnaseq_result_dir(disease_code):
+    return os.path.join(cache_data_dir(), disease_code, 'gene_expression')
 
-def load_rnaseq_data(disease_code,
-                     with_clinical=False,
-                     wait_time=30):
-    # Fetch RNA data
-    archive_path = prefetch_rnaseq_data(disease_code)
+def _extract_rnaseq_archive(disease_code, wait_time=30, on_extract=None):
+    # Gene quantification files are extracted while the archive downloads
+    result_dir = _rnaseq_result_dir(disease_code)
+    prefetch_rnaseq_data(disease_code,
+                         wait_time=wait_time,
+                         extract_to=result_dir,
+                         on_extract=on_extract)
+    return result_dir
 
-    result_dir = os.path.join(os.path.dirname(archive_path), disease_code, 'gene_expression')
-
-    if not os.path.exists(result_dir):
-        os.makedirs(result_dir)
-        # Unpack tar file
-        archive = tarfile.open(archive_path)
-
-        gene_quantification_files = set(el for el in archive if 'genes.normalized_results' in el.name)
-        if len(gene_quantification_files.difference(os.listdir(result_dir))) > 0:
-            archive.extractall(members=gene_quantification_files, path=result_dir)
-            archive.extract('FILE_SAMPLE_MAP.txt', path=result_dir)
+def _load_rna_file_sample_map(result_dir):
+    return _parse_rna_file_sample_map(os.path.join(result_dir, FILE_SAMPLE_MAP_FILE))
 
+def _parse_rna_file_sample_map(sample_map_file):
     # Load map from samples to RNA files
-    rna_file_sample_map = pd.read_csv(os.path.join(result_dir, 'FILE_SAMPLE_MAP.txt'), sep='\t')
+    rna_file_sample_map = pd.read_csv(sample_map_file, sep='\t')
     rna_file_sample_map_id_split = rna_file_sample_map['barcode(s)'].str.rsplit('-', n=4, expand=True)
     rna_file_sample_map_id_split.columns = ['TCGA_ID', 'SampleID', 'PortionID', 'PlateID', 'CenterID']
 
     rna_file_sample_map = rna_file_sample_map.join(rna_file_sample_map_id_split)
 
-    gene_filter = rna_file_sample_map['filename'].str.contains('genes.normalized_results')
-    gene_rna_file_sample_map = rna_file_sample_map[gene_filter]
+    gene_filter = rna_file_sample_map['filename'].str.contains(GENE_QUANTIFICATION_FILE_CODE)
+    return rna_file_sample_map[gene_filter]
+
+def _load_rnaseq_sample_files(disease_code, wait_time=30):
+    """Parse the gene quantification file of each sample, returns the list
+    of dataframes and the sample map indexed by `sample_index` in the same
+    order"""
+    # Files of a downloading archive are parsed as soon as they are extracted
+    streamed = {}
+    def parse_extracted(path):
+        file_name = os.path.basename(path)
+        if GENE_QUANTIFICATION_FILE_CODE in file_name:
+            streamed[file_name] = pd.read_csv(path, sep='\t')
+
+    result_dir = _extract_rnaseq_archive(disease_code,
+                                         wait_time=wait_time,
+                                         on_extract=parse_extracted)
+
+    rna_file_sample_map = _load_rna_file_sample_map(result_dir).reset_index(drop=True)
+    rna_file_sample_map.index.name = 'sample_index'
+
+    with span('rnaseq.parse', files=len(rna_file_sample_map), streamed=len(streamed)):
+        rna_dfs = [streamed.pop(f) if f in streamed else pd.read_csv(os.path.join(result_dir, f), sep='\t')
+                    for f in rna_file_sample_map['filename']]
+    return rna_dfs, rna_file_sample_map
+
+def load_rnaseq_data(disease_code,
+                     with_clinical=False,
+                     wait_time=30,
+                     sample_table=False):
+    """Load RNASeqV2 gene quantification from TCGA
+
+    Parameters
+    ----------
+    disease_code : str
 
-    rna_dfs = []
-    for (f, sample) in list(zip(gene_rna_file_sample_map['filename'], gene_rna_file_sample_map['TCGA_ID'])):
-        sample_rna_df = pd.read_csv(os.path.join(result_dir, f), sep='\t')
-        sample_rna_df['TCGA_ID'] = sample
+    with_clinical : bool, optional
+        If True, attach the clinical information
+    wait_time : int, optional
+        Time to wait for response from TCGA
+    sample_table : bool, optional
+        If True, return the expression rows keyed by an integer
+        `sample_index` along with a separate table of sample metadata
+        instead of repeating the metadata on every row. The clinical
+        information is then attached to the sample table.
 
-        sample_rna_df['gene_name'] = sample_rna_df.gene_id.str.split('|').str.get(0)
-        rna_dfs.append(sample_rna_df)
+    Returns
+    -------
+    rna_df : Pandas dataframe
+        A dataframe of gene expression values, one row per gene and sample
+    samples : Pandas dataframe
+        Only if `sample_table` is True, the sample metadata indexed by
+        `sample_index`
+    """
+    (rna_dfs, rna_file_sample_map) = _load_rnaseq_sample_files(disease_code, wait_time=wait_time)
 
-    rna_df = pd.concat(rna_dfs, copy=False).merge(rna_file_sample_map)
+    with span('rnaseq.concat') as parse_span:
+        # Each file holds a single sample, so its metadata is attached by position
+        sample_index = np.repeat(np.arange(len(rna_dfs)),
+                                 [len(sample_rna_df) for sample_rna_df in rna_dfs])
+        rna_df = pd.concat(rna_dfs, ignore_index=True)
+        rna_df['gene_name'] = rna_df.gene_id.str.split('|').str.get(0)
+        rna_df['sample_index'] = sample_index
+        parse_span.add(rows=len(rna_df))
+
+    if sample_table:
+        if with_clinical:
+            rna_file_sample_map = _attach_clinical(rna_file_sample_map, disease_code)
+        return rna_df, rna_file_sample_map
+
+    with span('rnaseq.attach_samples'):
+        for column in rna_file_sample_map.columns:
+            rna_df[column] = rna_file_sample_map[column].values.take(sample_index)
+        del rna_df['sample_index']
 
     if with_clinical:
         patient_data_df = load_clinical_data(disease_code)
-        merged = rna_df.merge(patient_data_df,
-                              how='outer',
-                              left_on='TCGA_ID', 
-                              right_on='bcr_patient_barcode')
+        with span('rnaseq.merge_clinical') as merge_span:
+            merged = rna_df.merge(patient_data_df,
+                                  how='outer',
+                                  left_on='TCGA_ID',
+                                  right_on='bcr_patient_barcode')
+            merge_span.add(rows=len(merged))
 
         return merged
-    else: 
-        return rna_df
\ No newline at end of file
+    else:
+        return rna_df
+
+def _attach_clinical(samples, disease_code):
+    """Attach the clinical data of each sample's patient, one row per sample"""
+    patient_data_df = load_clinical_data(disease_code)
+    with span('rnaseq.attach_clinical') as attach_span:
+        (patient_index, patients) = index_patients(samples['TCGA_ID'], patient_data_df)
+        samples = attach_columns(samples.assign(patient_index=patient_index), patients, 'patient_index')
+        attach_span.add(rows=len(samples))
+    return samples
+
+def expression_matrix(rna_dfs, sample_labels):
+    """Combine gene quantification files into a gene by sample matrix
+
+    Parameters
+    ----------
+    rna_dfs : list of Pandas dataframes
+        'gene_id' and 'normalized_count' of each sample
+    sample_labels : list
+        Column label of each sample
+
+    Returns
+    -------
+    expression : Pandas dataframe
+        Normalized counts indexed by 'gene_id', missing for genes absent
+        from a sample's file
+    """
+    genes = rna_dfs[0]['gene_id'].values if rna_dfs else np.array([], dtype=object)
+    if all(np.array_equal(sample_rna_df['gene_id'].values, genes) for sample_rna_df in rna_dfs):
+        # Files list the same genes in the same order, the usual case
+        values = np.empty((len(genes), len(rna_dfs)))
+        for (i, sample_rna_df) in enumerate(rna_dfs):
+            values[:, i] = sample_rna_df['normalized_count'].values
+    else:
+        (gene_codes, genes) = pd.factorize(np.concatenate(
+            [sample_rna_df['gene_id'].values for sample_rna_df in rna_dfs]))
+        sample_index = np.repeat(np.arange(len(rna_dfs)),
+                                 [len(sample_rna_df) for sample_rna_df in rna_dfs])
+        values = np.full((len(genes), len(rna_dfs)), np.nan)
+        values[gene_codes, sample_index] = np.concatenate(
+            [sample_rna_df['normalized_count'].values for sample_rna_df in rna_dfs])
+
+    return pd.DataFrame(values,
+                        index=pd.Index(genes, name='gene_id'),
+                        columns=pd.Index(sample_labels, name='barcode'))
+
+def load_rnaseq_matrix(disease_code,
+                       with_clinical=False,
+                       wait_time=30):
+    """Load RNASeqV2 gene quantification as a gene by sample matrix
+
+    Parameters
+    ----------
+    disease_code : str
+
+    with_clinical : bool, optional
+        If True, attach the clinical information to the sample table
+    wait_time : int, optional
+        Time to wait for response from TCGA
+
+    Returns
+    -------
+    expression : Pandas dataframe
+        Normalized counts with a row per gene, indexed by 'gene_id', and a
+        column per sample, in the order of the rows of `samples`
+    samples : Pandas dataframe
+        Sample metadata, and clinical data if `with_clinical`, one row per
+        sample indexed by `sample_index`
+    """
+    (rna_dfs, samples) = _load_rnaseq_sample_files(disease_code, wait_time=wait_time)
+
+    with span('rnaseq.matrix') as matrix_span:
+        expression = expression_matrix(rna_dfs, samples['barcode(s)'].values)
+        del rna_dfs
+        matrix_span.add(rows=len(expression))
+
+    if with_clinical:
+        samples = _attach_clinical(samples, disease_code)
+    return expression, samples
+
+def _iter_rnaseq_sample_files(disease_code, wait_time=30):
+    """Yield an open file (or path) for each gene quantification file of a
+    disease in the order of the sample map, reading directly from the
+    archive if it hasn't been extracted"""
+    archive_path = prefetch_rnaseq_data(disease_code, wait_time=wait_time)
+    result_dir = _rnaseq_result_dir(disease_code)
+
+    if is_extracted(archive_path, result_dir):
+        for f in _load_rna_file_sample_map(result_dir)['filename']:
+            yield os.path.join(result_dir, f)
+    else:
+        with tarfile.open(archive_path) as archive:
+            members = dict((os.path.basename(member.name), member) for member in archive)
+            rna_file_sample_map = _parse_rna_file_sample_map(
+                archive.extractfile(members[FILE_SAMPLE_MAP_FILE]))
+            for f in rna_file_sample_map['filename']:
+                yield archive.extractfile(members[f])
+
+class GeneStatisticsAccumulator(object):
+    """Accumulates per-gene summary statistics one sample at a time
+
+    Mean and variance are computed with Welford's online algorithm, vectorized
+    across genes, and quantiles are approximated from a histogram of each gene
+    over log2(x + 1) so memory is bounded by the number of genes, not samples.
+
+    Genes are those of the first sample. Missing values, e.g. genes absent
+    from a later sample, are skipped and only counted for the other genes.
+
+    Parameters
+    ----------
+    quantiles : sequence of float, optional
+        Quantiles to estimate for each gene
+    log2 : bool, optional
+        If True, accumulate log2(x + 1) of the expression values
+    n_bins : int, optional
+        Number of histogram bins used to approximate the quantiles, spread
+        evenly over log2(x + 1) between 0 and 25
+    """
+    LOG2_RANGE = (0., 25.)
+
+    def __init__(self,
+                 quantiles=(0.25, 0.5, 0.75),
+                 log2=False,
+                 n_bins=512):
+        self.quantiles = tuple(quantiles)
+        self.log2 = log2
+        self.n_bins = n_bins
+        self.bin_edges = np.linspace(self.LOG2_RANGE[0], self.LOG2_RANGE[1], n_bins + 1)
+
+        self.gene_ids = None
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+        self._min = None
+        self._max = None
+        self._histogram = None
+
+    def _start(self, gene_ids):
+        n_genes = len(gene_ids)
+        self.gene_ids = pd.Index(gene_ids)
+        self._counts = np.zeros(n_genes, dtype=np.int64)
+        self._mean = np.zeros(n_genes)
+        self._m2 = np.zeros(n_genes)
+        self._min = np.full(n_genes, np.inf)
+        self._max = np.full(n_genes, -np.inf)
+        if self.quantiles:
+            self._histogram = np.zeros((n_genes, self.n_bins), dtype=np.int32)
+
+    def update(self, gene_ids, values):
+        """Add a single sample's expression values"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.gene_ids is None:
+            self._start(gene_ids)
+        elif not self.gene_ids.equals(pd.Index(gene_ids)):
+            values = pd.Series(values, index=gene_ids).reindex(self.gene_ids).values
+
+        log_values = np.log2(values + 1)
+        if self.log2:
+            values = log_values
+
+        self.count += 1
+        present = ~np.isnan(values)
+        self._counts += present
+        delta = np.where(present, values - self._mean, 0.)
+        self._mean += delta / np.maximum(self._counts, 1)
+        self._m2 += np.where(present, delta * (values - self._mean), 0.)
+        np.fmin(self._min, values, out=self._min)
+        np.fmax(self._max, values, out=self._max)
+
+        if self._histogram is not None:
+            bins = np.searchsorted(self.bin_edges, log_values[present], side='right') - 1
+            np.clip(bins, 0, self.n_bins - 1, out=bins)
+            self._histogram[np.flatnonzero(present), bins] += 1
+
+    def _quantile(self, q):
+        cumulative = np.cumsum(self._histogram, axis=1)
+        target = q * self._counts
+        bins = (cumulative < target[:, np.newaxis]).sum(axis=1)
+        np.clip(bins, 0, self.n_bins - 1, out=bins)
+        rows = np.arange(len(bins))
+        below = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+        in_bin = self._histogram[rows, bins]
+        fraction = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.)
+        lower = self.bin_edges[bins]
+        upper = self.bin_edges[bins + 1]
+        estimate = lower + fraction * (upper - lower)
+        if not self.log2:
+            estimate = np.exp2(estimate) - 1
+        return np.clip(estimate, self._min, self._max)
+
+    def result(self):
+        """Return a dataframe of per-gene statistics indexed by gene_id"""
+        if self.gene_ids is None:
+            return pd.DataFrame(columns=['count', 'mean', 'variance', 'std', 'min', 'max'])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = np.where(self._counts > 1, self._m2 / (self._counts - 1), np.nan)
+
+        stats = pd.DataFrame({'count': self._counts,
+                              'mean': self._mean,
+                              'variance': variance,
+                              'std': np.sqrt(variance),
+                              'min': self._min,
+                              'max': self._max},
+                             index=self.gene_ids)
+        stats.index.name = 'gene_id'
+        for q in self.quantiles:
+            stats['q{:g}'.format(q * 100)] = self._quantile(q)
+        # Genes without any value
+        stats.loc[self._counts == 0, stats.columns != 'count'] = np.nan
+        return stats
+
+def rnaseq_gene_statistics(disease_code,
+                           quantiles=(0.25, 0.5, 0.75),
+                           log2=False,
+                           n_bins=512,
+                           wait_time=30):
+    """Compute per-gene summary statistics in a single streaming pass
+
+    Sample files are read one at a time, from the extracted gene expression
+    directory or directly from the archive, so the full expression table is
+    never materialized.
+
+    Parameters
+    ----------
+    disease_code : str or list of str
+        TCGA disease code, or a list of codes to summarize pan-cancer
+    quantiles : sequence of float, optional
+        Quantiles to approximate for each gene
+    log2 : bool, optional
+        If True, summarize log2(normalized_count + 1)
+    n_bins : int, optional
+        Histogram resolution used to approximate quantiles
+    wait_time : int, optional
+        Time to wait for response from TCGA
+
+    Returns
+    -------
+    gene_stats : Pandas dataframe
+        Dataframe indexed by gene_id with count, mean, variance, std, min,
+        max and the requested quantiles
+    """
+    if isinstance(disease_code, str):
+        disease_codes = [disease_code]
+    else:
+        disease_codes = list(disease_code)
+
+    accumulator = GeneStatisticsAccumulator(quantiles=quantiles,
+                                            log2=log2,
+                                            n_bins=n_bins)
+    for code in disease_codes:
+        for sample_file in _iter_rnaseq_sample_files(code, wait_time=wait_time):
+            sample_rna_df = pd.read_csv(sample_file,
+                                        sep='\t',
+                                        usecols=['gene_id', 'normalized_count'])
+            accumulator.update(sample_rna_df['gene_id'].values,
+                               sample_rna_df['normalized_count'].values)
+
+    gene_stats = accumulator.result()
+    gene_stats.insert(0, 'gene_name', gene_stats.index.str.split('|').str.get(0))
+    return gene_stats
+
+def top_variable_genes(disease_code,
+                       k=1000,
+                       log2=True,
+                       wait_time=30):
+    """Return the `k` genes with the highest variance across samples
+
+    Parameters
+    ----------
+    disease_code : str or list of str
+        TCGA disease code, or a list of codes to filter pan-cancer
+    k : int, optional
+        Number of genes to return
+    log2 : bool, optional
+        If True, rank genes by the variance of log2(normalized_count + 1)
+    wait_time : int, optional
+        Time to wait for response from TCGA
+
+    Returns
+    -------
+    gene_stats : Pandas dataframe
+        Statistics of the top `k` genes sorted by decreasing variance
+    """
+    gene_stats = rnaseq_gene_statistics(disease_code,
+                                        quantiles=(),
+                                        log2=log2,
+                                        wait_time=wait_time)
+    return gene_stats.nlargest(k, 'variance')
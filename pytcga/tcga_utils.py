@@ -1,3 +1,7 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import requests
 
@@ -9,30 +13,211 @@ else:
     from io import StringIO
 
 from .urls import CODE_TABLE_ADDRESS
+from .tcga_requests import cache_data_dir, is_offline, check_online, NETWORK_TIMEOUT
+from .tcga_cache import write_atomically
+
+STUDIES_CACHE_FILE = 'studies.csv'
+
+# Seconds the cached list of studies is used before it is fetched again
+STUDIES_MAX_AGE = 7 * 24 * 60 * 60
+
+_studies_cache = {}
+
+# Threads parsing the files of a multi-file table, pandas' C parser releases
+# the GIL while tokenizing so files are parsed concurrently
+PARSE_WORKERS = min(8, os.cpu_count() or 1)
+
+# Length of the prefix of a TCGA barcode identifying each level of the
+# biospecimen hierarchy, e.g. for TCGA-02-0001-01C-01D-0182-01
+#   patient TCGA-02-0001, sample TCGA-02-0001-01C, portion TCGA-02-0001-01C-01,
+#   analyte TCGA-02-0001-01C-01D, aliquot TCGA-02-0001-01C-01D-0182-01
+TCGA_BARCODE_LEVELS = ['patient', 'sample', 'portion', 'analyte', 'aliquot']
+TCGA_BARCODE_LENGTHS = {
+    'patient': 12,
+    'sample': 16,
+    'portion': 19,
+    'analyte': 20,
+    'aliquot': 28,
+}
+
+def barcode_column(level):
+    """Name of the biotab column holding barcodes of the given level"""
+    return 'bcr_{}_barcode'.format(level)
+
+def barcode_prefix(barcodes, level):
+    """Truncate TCGA barcodes to the given level of the hierarchy
+
+    Parameters
+    ----------
+    barcodes : Pandas series or list of str
+    level : str
+        One of 'patient', 'sample', 'portion', 'analyte' or 'aliquot'
+
+    Returns
+    -------
+    prefixes : Pandas series
+    """
+    if level not in TCGA_BARCODE_LENGTHS:
+        raise ValueError('Unknown barcode level {}, expected one of {}'.format(
+            level, TCGA_BARCODE_LEVELS))
+    return pd.Series(barcodes).str.slice(0, TCGA_BARCODE_LENGTHS[level])
 
 def load_tcga_tabfile(path,
-                      skiprows=0):
-    columns = pd.read_csv(path,
-                          sep='\t',
-                          skiprows=skiprows,
-                          nrows=10).columns
+                      skiprows=0,
+                      dtype=None,
+                      usecols=None):
+    """Load a TCGA biotab file in a single pass
+
+    Biotab files have a row of column names followed by a row of CDE IDs,
+    the names are used as the header and the CDE ID row is dropped.
+
+    Parameters
+    ----------
+    path : str
+        Path to the biotab file
+    skiprows : int, optional
+        Number of rows to skip before the row of column names
+    dtype : type or dict, optional
+        Data type for the data or for specific columns
+    usecols : list, optional
+        Subset of columns to load
+
+    Returns
+    -------
+    df : Pandas dataframe
+    """
     df = pd.read_csv(path,
-                    sep='\t',
-                    skiprows=skiprows + 1,
-                    header=0,
-                    names=columns,
-                    na_values='[Not Available]')
+                     sep='\t',
+                     header=0,
+                     # Row numbers rather than a callable, which the C parser
+                     # would call back into Python for on every row
+                     skiprows=list(range(skiprows)) + [skiprows + 1],
+                     dtype=dtype,
+                     usecols=usecols,
+                     na_values='[Not Available]')
 
     return df
 
-def load_studies():
+def attach_columns(df, table, key, columns=None):
+    """Wide join of `table` onto the rows of `df` by index label
+
+    Parameters
+    ----------
+    df : Pandas dataframe
+    table : Pandas dataframe
+        Table indexed by the values of `df[key]`, e.g. patients indexed by
+        `patient_index`
+    key : str
+        Column of `df` holding index labels of `table`
+    columns : list of str, optional
+        Columns of `table` to attach, by default all those not in `df`
+
+    Returns
+    -------
+    joined : Pandas dataframe
+        `df` with the columns of the matching row of `table`, missing for
+        labels not in `table`
+    """
+    if columns is None:
+        columns = table.columns
+    columns = [column for column in columns if column not in df.columns]
+    attached = table[columns].reindex(df[key].values)
+    attached.index = df.index
+    return pd.concat([df, attached], axis=1)
+
+def load_tcga_tabfiles(paths,
+                       skiprows=0,
+                       dtype=None,
+                       usecols=None,
+                       max_workers=PARSE_WORKERS):
+    """Load several TCGA biotab files concurrently
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to the biotab files
+    skiprows, dtype, usecols : optional
+        See `load_tcga_tabfile`
+    max_workers : int, optional
+        Number of files parsed at the same time
+
+    Returns
+    -------
+    dfs : list of Pandas dataframes
+        A dataframe for each file, in the order of `paths`
+    """
+    def load(path):
+        return load_tcga_tabfile(path, skiprows=skiprows, dtype=dtype, usecols=usecols)
+
+    if len(paths) < 2 or max_workers < 2:
+        return [load(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        return list(executor.map(load, paths))
+
+def _fetch_studies():
     payload = {'exportType': 'csv',
                'dir': 'undefined',
                'sort': 'undefined',
                'codeTablesReport': 'bcrBatchCode'}
-    r = requests.post(CODE_TABLE_ADDRESS, payload)
-    df = pd.DataFrame.from_csv(StringIO(r.text))
+    check_online('list of TCGA studies')
+    r = requests.post(CODE_TABLE_ADDRESS, payload, timeout=NETWORK_TIMEOUT)
+    r.raise_for_status()
+    df = pd.read_csv(StringIO(r.text), index_col=0)
     return df[['Study Abbreviation', 'Study Name']] \
             .drop_duplicates() \
             .sort_values(by="Study Abbreviation") \
             .reset_index(drop=True)
+
+def load_studies(max_age=STUDIES_MAX_AGE, cache=True):
+    """Load the list of TCGA studies and their abbreviations
+
+    The list is cached in memory and on disk for `max_age` seconds. If the
+    code table can't be fetched, or in offline mode, the last cached copy is
+    returned regardless of its age.
+
+    Parameters
+    ----------
+    max_age : int, optional
+        Seconds a cached study list is considered fresh
+    cache : bool, optional
+        Whether to use and update the cached study list
+
+    Returns
+    -------
+    studies : Pandas dataframe
+        Dataframe with 'Study Abbreviation' and 'Study Name' columns
+    """
+    cache_path = os.path.join(cache_data_dir(), STUDIES_CACHE_FILE)
+
+    if is_offline():
+        max_age = float('inf')
+
+    if cache or is_offline():
+        if 'studies' in _studies_cache and \
+                time.time() - _studies_cache['loaded_at'] < max_age:
+            return _studies_cache['studies'].copy()
+
+        if os.path.exists(cache_path) and \
+                time.time() - os.path.getmtime(cache_path) < max_age:
+            return _cache_studies(pd.read_csv(cache_path),
+                                  loaded_at=os.path.getmtime(cache_path))
+
+    try:
+        studies = _fetch_studies()
+    except (requests.RequestException, ValueError, KeyError) as e:
+        if not os.path.exists(cache_path):
+            raise
+        logging.warning('Unable to fetch TCGA studies ({}), using cached copy {}'.format(
+            e, cache_path))
+        return pd.read_csv(cache_path)
+
+    if cache:
+        write_atomically(cache_path, lambda tmp_path: studies.to_csv(tmp_path, index=False))
+        _cache_studies(studies, loaded_at=time.time())
+
+    return studies
+
+def _cache_studies(studies, loaded_at):
+    _studies_cache['studies'] = studies
+    _studies_cache['loaded_at'] = loaded_at
+    return studies.copy()
@@ -36,8 +36,11 @@ if __name__ == '__main__':
             'Operating System :: OS Independent',
             'Intended Audience :: Science/Research',
             'Programming Language :: Python',
+            'Programming Language :: Python :: 3',
+            'Programming Language :: Python :: 3 :: Only',
             'Topic :: Scientific/Engineering :: Bio-Informatics',
         ],
+        python_requires='>=3.9',
         install_requires=[
             'pandas >=0.13.1',
             'nose >=1.3.6',
@@ -45,6 +48,12 @@ if __name__ == '__main__':
             'requests>=2.9.1',
 	    'appdirs>=1.4.0',
         ],
+        extras_require={
+            'parquet': ['pyarrow'],
+        },
+        entry_points={
+            'console_scripts': ['pytcga=pytcga.cli:main'],
+        },
         long_description=readme,
         packages=find_packages(exclude=["test", "tests"]),
     )
@@ -0,0 +1,33 @@
+"""Setup shared by the tests using a pytcga cache"""
+import shutil
+import tempfile
+
+import requests
+
+from pytcga import tcga_requests, tcga_utils
+from pytcga.tcga_cache import clear_memory_cache
+
+def no_network(*args, **kwargs):
+    raise AssertionError('Accessed the network')
+
+def temporary_cache(test):
+    """Run `test` with the pytcga cache in a new directory, passed as its
+    argument. Tests may replace requests.get and requests.post, they are
+    restored afterwards along with the in-memory caches."""
+    def run():
+        base_directory = tcga_requests.PYTCGA_BASE_DIRECTORY
+        (get, post) = (requests.get, requests.post)
+        cache_directory = tempfile.mkdtemp()
+        try:
+            tcga_requests.PYTCGA_BASE_DIRECTORY = cache_directory
+            clear_memory_cache()
+            tcga_utils._studies_cache.clear()
+            test(cache_directory)
+        finally:
+            tcga_requests.PYTCGA_BASE_DIRECTORY = base_directory
+            (requests.get, requests.post) = (get, post)
+            clear_memory_cache()
+            tcga_utils._studies_cache.clear()
+            shutil.rmtree(cache_directory)
+    run.__name__ = test.__name__
+    return run
@@ -0,0 +1,71 @@
+from nose.tools import eq_
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+
+from pytcga.tcga_archive import (StreamingExtractor,
+                                 extract_archive,
+                                 is_extracted,
+                                 mark_extracted)
+
+def _write_archive(path, members):
+    with tarfile.open(path, 'w') as archive:
+        for (name, data) in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+def test_streaming_extractor():
+    directory = tempfile.mkdtemp()
+    try:
+        archive_path = os.path.join(directory, 'archive.tar')
+        _write_archive(archive_path, [('a.maf', b'x' * 5000), ('b.txt', b'y'), ('c.maf', b'z')])
+
+        extracted = []
+        extractor = StreamingExtractor(os.path.join(directory, 'out'),
+                                       member_filter=lambda name: name.endswith('.maf'),
+                                       on_extract=extracted.append).start()
+        with open(archive_path, 'rb') as f:
+            while True:
+                block = f.read(777)
+                if not block:
+                    break
+                extractor.write(block)
+        eq_(extractor.finish(), True)
+        eq_([os.path.basename(path) for path in extracted], ['a.maf', 'c.maf'])
+        eq_(sorted(os.listdir(os.path.join(directory, 'out'))), ['a.maf', 'c.maf'])
+
+        # A truncated archive fails without blocking the writer
+        extractor = StreamingExtractor(os.path.join(directory, 'truncated')).start()
+        with open(archive_path, 'rb') as f:
+            extractor.write(f.read(1000))
+        eq_(extractor.finish(), False)
+    finally:
+        shutil.rmtree(directory)
+
+def test_extract_archive():
+    directory = tempfile.mkdtemp()
+    try:
+        archive_path = os.path.join(directory, 'archive.tar')
+        out = os.path.join(directory, 'out')
+        _write_archive(archive_path, [('a.maf', b'x')])
+        eq_(is_extracted(archive_path, out), False)
+
+        extracted = []
+        extract_archive(archive_path, out, on_extract=extracted.append)
+        eq_(len(extracted), 1)
+        eq_(is_extracted(archive_path, out), True)
+
+        # Already extracted members are not extracted again
+        extract_archive(archive_path, out, on_extract=extracted.append)
+        eq_(len(extracted), 1)
+
+        # A new archive invalidates the extraction
+        _write_archive(archive_path, [('a.maf', b'x'), ('b.maf', b'y')])
+        eq_(is_extracted(archive_path, out), False)
+        mark_extracted(archive_path, out)
+        eq_(is_extracted(archive_path, out), True)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,58 @@
+from nose.tools import eq_
+import os
+import pandas as pd
+import requests
+
+from pytcga.tcga_cache import update_manifest
+from pytcga.tcga_barcode_index import BarcodeIndex, build_barcode_hierarchy, load_barcode_index
+
+from cache_helpers import temporary_cache, no_network
+
+BARCODES = ['TCGA-AA-0001-01A',
+            'TCGA-AA-0001-01A-11D',
+            'TCGA-AA-0001-01A-11D-0000-08',
+            'TCGA-AA-0001-01A-11R-0000-07',
+            'TCGA-AA-0001-10A',
+            'TCGA-AA-0002-01A-11D']
+
+def test_build_barcode_hierarchy():
+    hierarchy = build_barcode_hierarchy(BARCODES)
+    eq_(len(hierarchy), 4)
+    eq_(hierarchy['aliquot'].notnull().sum(), 2)
+    eq_(hierarchy['portion'].dropna().unique().tolist(), ['TCGA-AA-0001-01A-11', 'TCGA-AA-0002-01A-11'])
+
+def test_barcode_index_lookups():
+    index = BarcodeIndex(build_barcode_hierarchy(BARCODES))
+
+    eq_(index.lookup('TCGA-AA-0001', 'sample'), ['TCGA-AA-0001-01A', 'TCGA-AA-0001-10A'])
+    eq_(index.lookup('TCGA-AA-0001-01A', 'aliquot'),
+        ['TCGA-AA-0001-01A-11D-0000-08', 'TCGA-AA-0001-01A-11R-0000-07'])
+    eq_(index.lookup('TCGA-AA-0001-10A', 'aliquot'), [])
+    eq_(index.lookup('TCGA-XX-0001', 'sample'), [])
+
+    resolved = index.descendants(['TCGA-AA-0002', 'TCGA-AA-0001-01A'], 'analyte')
+    eq_(resolved['barcode'].tolist(), ['TCGA-AA-0002', 'TCGA-AA-0001-01A', 'TCGA-AA-0001-01A'])
+    eq_(resolved['analyte'].tolist(),
+        ['TCGA-AA-0002-01A-11D', 'TCGA-AA-0001-01A-11D', 'TCGA-AA-0001-01A-11R'])
+
+    barcodes = pd.Series(['TCGA-AA-0001-01A-11R-0000-07', 'TCGA-XX-0001-01A', 'TCGA-AA-0002-01A-11D'],
+                         index=[10, 11, 12])
+    patients = index.ancestor(barcodes, 'patient')
+    eq_(patients.index.tolist(), [10, 11, 12])
+    eq_(patients[10], 'TCGA-AA-0001')
+    assert pd.isnull(patients[11])
+    eq_(patients[12], 'TCGA-AA-0002')
+
+@temporary_cache
+def test_load_barcode_index_without_patient_file(cache_directory):
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    aliquot_file = 'nationwidechildrens.org_biospecimen_aliquot_luad.txt'
+    with open(os.path.join(disease_dir, aliquot_file), 'w') as f:
+        f.write('bcr_aliquot_barcode\nCDE_ID:\nTCGA-AA-0001-01A-01D-0001-01\n')
+    update_manifest(disease_dir, {aliquot_file: {'fetched_at': 0}})
+    # Every recorded file is cached, the cohort has no patient file
+    requests.get = no_network
+
+    index = load_barcode_index('LUAD')
+    eq_(index.lookup('TCGA-AA-0001', 'aliquot'), ['TCGA-AA-0001-01A-01D-0001-01'])
@@ -0,0 +1,49 @@
+from nose.tools import eq_, assert_raises
+import os
+
+import requests
+
+from pytcga.tcga_cache import update_manifest
+from pytcga.tcga_clinical import load_biospecimen_table
+
+from cache_helpers import temporary_cache, no_network
+
+def _write(directory, file_name, lines):
+    with open(os.path.join(directory, file_name), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+@temporary_cache
+def test_load_biospecimen_table(cache_directory):
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    _write(disease_dir, 'nationwidechildrens.org_clinical_patient_luad.txt',
+           ['bcr_patient_barcode', 'bcr_patient_barcode', 'CDE_ID:', 'TCGA-AA-0001'])
+    for center in ['0', '1']:
+        _write(disease_dir, 'nationwidechildrens.org_biospecimen_sample_luad_{}.txt'.format(center),
+               ['bcr_sample_barcode', 'CDE_ID:', 'TCGA-AA-000{}-01A'.format(center)])
+    _write(disease_dir, 'nationwidechildrens.org_clinical_drug_luad.txt',
+           ['bcr_patient_barcode', 'bcr_patient_barcode', 'CDE_ID:', 'TCGA-AA-0001'])
+
+    samples = load_biospecimen_table('LUAD', 'sample')
+    eq_(samples['bcr_sample_barcode'].tolist(), ['TCGA-AA-0000-01A', 'TCGA-AA-0001-01A'])
+    eq_(samples.index.tolist(), [0, 1])
+
+    drugs = load_biospecimen_table('LUAD', 'drug')
+    eq_(drugs['bcr_patient_barcode'].tolist(), ['TCGA-AA-0001'])
+
+    with assert_raises(ValueError):
+        load_biospecimen_table('LUAD', 'aliquot')
+    with assert_raises(ValueError):
+        load_biospecimen_table('LUAD', 'portion')
+
+@temporary_cache
+def test_load_biospecimen_table_without_patient_file(cache_directory):
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    sample_file = 'nationwidechildrens.org_biospecimen_sample_luad.txt'
+    _write(disease_dir, sample_file, ['bcr_sample_barcode', 'CDE_ID:', 'TCGA-AA-0001-01A'])
+    update_manifest(disease_dir, {sample_file: {'fetched_at': 0}})
+    # Every recorded file is cached, the cohort has no patient file
+    requests.get = no_network
+    samples = load_biospecimen_table('LUAD', 'sample')
+    eq_(samples['bcr_sample_barcode'].tolist(), ['TCGA-AA-0001-01A'])
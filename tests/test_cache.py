@@ -0,0 +1,134 @@
+from nose.tools import eq_, assert_raises
+import multiprocessing
+import os
+import shutil
+import tempfile
+import pandas as pd
+
+from pytcga.tcga_cache import (cached_table,
+                               clear_memory_cache,
+                               read_manifest,
+                               write_atomically,
+                               DataFrameCache,
+                               checksum_record,
+                               file_checksum,
+                               update_manifest,
+                               verify_cached_file,
+                               verify_cache)
+
+def test_cached_table():
+    directory = tempfile.mkdtemp()
+    source_path = os.path.join(directory, 'source.txt')
+    with open(source_path, 'w') as f:
+        f.write('a\n1\n')
+
+    clear_memory_cache()
+    calls = []
+    def loader():
+        calls.append(1)
+        return pd.read_csv(source_path)
+
+    first = cached_table(directory, 'source', [source_path], loader)
+    second = cached_table(directory, 'source', [source_path], loader)
+    eq_(len(calls), 1)
+    eq_(second['a'].tolist(), first['a'].tolist())
+
+    cached_table(directory, 'source', [source_path], loader, params={'option': True})
+    eq_(len(calls), 2)
+
+    with open(source_path, 'w') as f:
+        f.write('a\n1\n2\n')
+    changed = cached_table(directory, 'source', [source_path], loader)
+    eq_(len(calls), 3)
+    eq_(changed['a'].tolist(), [1, 2])
+
+    shutil.rmtree(directory)
+
+def test_dataframe_cache_eviction():
+    df = pd.DataFrame({'a': range(100)})
+    nbytes = df.memory_usage(deep=True).sum()
+    cache = DataFrameCache(max_bytes=2 * nbytes)
+
+    cache.put('first', df)
+    cache.put('second', df)
+    cache.get('first')
+    cache.put('third', df)
+
+    assert 'first' in cache
+    assert 'second' not in cache
+    assert 'third' in cache
+    eq_(cache.current_bytes, 2 * nbytes)
+
+def test_dataframe_cache_returns_copies():
+    cache = DataFrameCache()
+    cache.put('key', pd.DataFrame({'a': [1, 2]}))
+
+    df = cache.get('key')
+    df.loc[0, 'a'] = 10
+    df['b'] = 0
+
+    eq_(list(cache.get('key').columns), ['a'])
+    eq_(cache.get('key')['a'].tolist(), [1, 2])
+
+def test_verify_cached_file():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'archive.tar')
+    with open(path, 'wb') as f:
+        f.write(b'archive contents')
+
+    eq_(verify_cached_file(path), None)
+    update_manifest(directory, {'archive.tar': checksum_record(path, file_checksum(path))})
+    eq_(verify_cached_file(path), True)
+
+    # Same size but different contents is only caught by the full check
+    # or once the modification time changes
+    with open(path, 'r+b') as f:
+        f.write(b'ARCHIVE')
+    os.utime(path, (1, 1))
+    eq_(verify_cached_file(path), False)
+    eq_(verify_cache(directory), [path])
+
+    os.remove(path)
+    eq_(verify_cached_file(path), False)
+
+    shutil.rmtree(directory)
+
+def _update_manifest_entries(directory, worker):
+    for i in range(50):
+        update_manifest(directory, {'{}-{}'.format(worker, i): {'fetched_at': i}})
+
+def test_update_manifest_processes():
+    directory = tempfile.mkdtemp()
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=_update_manifest_entries, args=(directory, worker))
+               for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    eq_(len(read_manifest(directory)), 200)
+    shutil.rmtree(directory)
+
+def test_write_atomically():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'table')
+
+    def fail(tmp_path):
+        with open(tmp_path, 'w') as f:
+            f.write('partial')
+        raise IOError('disk full')
+
+    with assert_raises(IOError):
+        write_atomically(path, fail)
+    eq_(os.listdir(directory), [])
+
+    umask = os.umask(0o027)
+    try:
+        write_atomically(path, lambda tmp_path: pd.DataFrame({'a': [1]}).to_pickle(tmp_path))
+    finally:
+        os.umask(umask)
+    eq_(os.listdir(directory), ['table'])
+    # The file has the permissions the umask gives new files
+    eq_(os.stat(path).st_mode & 0o777, 0o640)
+    shutil.rmtree(directory)
@@ -0,0 +1,50 @@
+from nose.tools import eq_, ok_
+import os
+
+import requests
+
+from pytcga import cli
+from pytcga.tcga_requests import RequestError
+from pytcga.tcga_cache import update_manifest
+from pytcga.tcga_barcode_index import load_barcode_index
+from pytcga.instrumentation import span
+
+from cache_helpers import temporary_cache, no_network
+
+def _prefetch(disease_code, wait_time=30):
+    if disease_code == 'OV':
+        raise RequestError('204', 'No Content')
+    with span('download') as download_span:
+        download_span.add(bytes=10)
+
+def test_prefetch_cohorts():
+    data_types = cli.PREFETCH_DATA_TYPES
+    cli.PREFETCH_DATA_TYPES = {'clinical': _prefetch, 'rnaseq': _prefetch}
+    try:
+        report = cli.prefetch_cohorts(['luad', 'OV'], workers=2)
+        eq_(report['disease'].tolist(), ['LUAD', 'LUAD', 'OV', 'OV'])
+        eq_(report['data_type'].tolist(), ['clinical', 'rnaseq', 'clinical', 'rnaseq'])
+        eq_(report['status'].tolist(), ['ok', 'ok', 'failed', 'failed'])
+        eq_(report['bytes'].tolist(), [10, 10, 0, 0])
+        ok_('No Content' in report['error'].iloc[2])
+        ok_('2 of 4 prefetched' in cli.format_report(report))
+
+        eq_(cli.main(['prefetch', 'LUAD', '--data-type', 'rnaseq']), 0)
+        eq_(cli.main(['prefetch', 'LUAD', 'OV']), 1)
+    finally:
+        cli.PREFETCH_DATA_TYPES = data_types
+
+@temporary_cache
+def test_prefetch_clinical_without_patient_file(cache_directory):
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    aliquot_file = 'nationwidechildrens.org_biospecimen_aliquot_luad.txt'
+    with open(os.path.join(disease_dir, aliquot_file), 'w') as f:
+        f.write('bcr_aliquot_barcode\nCDE_ID:\nTCGA-AA-0001-01A-01D-0001-01\n')
+    update_manifest(disease_dir, {aliquot_file: {'fetched_at': 0}})
+    requests.get = no_network
+
+    report = cli.prefetch_cohorts(['LUAD'], data_types=['clinical'])
+    eq_(report['status'].tolist(), ['ok'])
+    eq_(load_barcode_index('LUAD').lookup('TCGA-AA-0001', 'aliquot'),
+        ['TCGA-AA-0001-01A-01D-0001-01'])
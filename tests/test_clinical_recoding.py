@@ -0,0 +1,27 @@
+from nose.tools import eq_
+import numpy as np
+import pandas as pd
+
+from pytcga.tcga_clinical import recode_series, recode_clinical_columns
+
+def test_recode_series():
+    series = pd.Series(['1', '2', np.nan, '1', '[Unknown]'])
+    recoded = recode_series(series, {'1': 'No', '2': 'Yes'})
+
+    eq_(recoded.tolist()[:2], ['No', 'Yes'])
+    assert pd.isnull(recoded[2])
+    eq_(recoded.tolist()[3:], ['No', '[Unknown]'])
+
+def test_recode_series_categorical_merges_codes():
+    series = pd.Series(['1', 'No', '2'])
+    recoded = recode_series(series, {'1': 'No', '2': 'Yes'}, categorical=True)
+
+    eq_(recoded.tolist(), ['No', 'No', 'Yes'])
+    eq_(list(recoded.cat.categories), ['No', 'Yes'])
+
+def test_recode_clinical_columns():
+    clinical_df = pd.DataFrame({'coded': ['a', 'b'], 'other': ['a', 'b']})
+    recode_clinical_columns(clinical_df, {'coded': {'a': 'A'}, 'missing': {}})
+
+    eq_(clinical_df['coded'].tolist(), ['A', 'b'])
+    eq_(clinical_df['other'].tolist(), ['a', 'b'])
@@ -0,0 +1,98 @@
+from nose.tools import eq_, ok_, assert_raises
+import os
+
+import requests
+import pandas as pd
+
+from pytcga.tcga_cohort import Cohort
+
+from cache_helpers import temporary_cache, no_network
+
+def _write(directory, file_name, rows):
+    with open(os.path.join(directory, file_name), 'w') as f:
+        f.write(''.join('\t'.join(row) + '\n' for row in rows))
+
+def _write_cohort(cache_directory):
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    _write(disease_dir, 'nationwidechildrens.org_clinical_patient_luad.txt',
+           [['bcr_patient_barcode', 'tissue_source_site', 'age'],
+            ['bcr_patient_barcode', 'tissue_source_site', 'age'],
+            ['CDE_ID:', 'CDE_ID:', 'CDE_ID:'],
+            ['TCGA-AA-0001', 'AA', '60'],
+            ['TCGA-AA-0002', 'AA', '70']])
+    _write(disease_dir, 'nationwidechildrens.org_biospecimen_sample_luad.txt',
+           [['bcr_sample_barcode', 'bcr_patient_barcode', 'tissue_source_site', 'sample_type'],
+            ['CDE_ID:', 'CDE_ID:', 'CDE_ID:', 'CDE_ID:'],
+            ['TCGA-AA-0001-01A', 'TCGA-AA-0001', 'AA', 'Primary Tumor'],
+            ['TCGA-AA-0001-10A', 'TCGA-AA-0001', 'AA', 'Blood Derived Normal'],
+            ['TCGA-AA-0002-01A', 'TCGA-AA-0002', 'AA', 'Primary Tumor']])
+    _write(disease_dir, 'nationwidechildrens.org_biospecimen_analyte_luad.txt',
+           [['bcr_analyte_barcode', 'analyte_type'],
+            ['CDE_ID:', 'CDE_ID:'],
+            ['TCGA-AA-0001-01A-01D', 'DNA'],
+            ['TCGA-AA-0001-01A-01R', 'RNA'],
+            ['TCGA-AA-0002-01A-01D', 'DNA']])
+    _write(disease_dir, 'nationwidechildrens.org_clinical_drug_luad.txt',
+           [['bcr_patient_barcode', 'drug_name'],
+            ['bcr_patient_barcode', 'drug_name'],
+            ['CDE_ID:', 'CDE_ID:'],
+            ['TCGA-AA-0001', 'Cisplatin'],
+            ['TCGA-AA-0001', 'Pemetrexed']])
+    # The patient file is cached, the tables load without the network
+    requests.get = no_network
+
+@temporary_cache
+def test_cohort_tables(cache_directory):
+    _write_cohort(cache_directory)
+    luad = Cohort('LUAD', recode_columns=False)
+
+    eq_(luad.samples.index.name, 'bcr_sample_barcode')
+    eq_(luad.analytes['bcr_sample_barcode'].tolist(),
+        ['TCGA-AA-0001-01A', 'TCGA-AA-0001-01A', 'TCGA-AA-0002-01A'])
+    eq_(luad.analytes['bcr_patient_barcode'].tolist(),
+        ['TCGA-AA-0001', 'TCGA-AA-0001', 'TCGA-AA-0002'])
+    # Drugs have several rows per patient and keep their default index
+    eq_(luad.drugs.index.tolist(), [0, 1])
+    ok_(luad.table('samples') is luad.samples)
+    eq_(repr(luad), "Cohort('LUAD', loaded=['analytes', 'drugs', 'samples'])")
+
+    with assert_raises(ValueError):
+        luad.table('portions')
+
+@temporary_cache
+def test_cohort_join(cache_directory):
+    _write_cohort(cache_directory)
+    luad = Cohort('LUAD', recode_columns=False)
+
+    # Joined on the indexes, the shared columns appear once
+    joined = luad.join('analytes', 'samples', 'patients')
+    eq_(joined.columns.tolist(),
+        ['bcr_analyte_barcode', 'analyte_type', 'bcr_patient_barcode', 'bcr_sample_barcode',
+         'bcr_portion_barcode', 'tissue_source_site', 'sample_type', 'age'])
+    eq_(joined['sample_type'].tolist(), ['Primary Tumor'] * 3)
+    eq_(joined['age'].tolist(), [60, 60, 70])
+
+    # Drugs are merged, one row per sample and drug
+    joined = luad.join('samples', 'drugs')
+    eq_(len(joined), 5)
+    eq_(joined['drug_name'].tolist()[:4], ['Cisplatin', 'Pemetrexed'] * 2)
+    ok_(pd.isnull(joined['drug_name'].iloc[4]))
+
+    # After merging the samples the rows are samples, analytes are joined on
+    # the sample rather than the patient barcode
+    joined = luad.join('drugs', 'samples', 'analytes')
+    eq_(len(joined), 6)
+    eq_(joined.groupby('bcr_sample_barcode')['analyte_type'].count().to_dict(),
+        {'TCGA-AA-0001-01A': 4, 'TCGA-AA-0001-10A': 0})
+
+    joined = luad.join('samples', 'patients',
+                       columns={'samples': ['bcr_patient_barcode', 'sample_type'],
+                                'patients': ['age']})
+    eq_(joined.columns.tolist(), ['bcr_sample_barcode', 'bcr_patient_barcode', 'sample_type', 'age'])
+    eq_(joined['age'].tolist(), [60, 60, 70])
+
+    with assert_raises(TypeError):
+        luad.join('samples', 'patients', on='bcr_patient_barcode')
+    with assert_raises(ValueError):
+        luad.join()
@@ -0,0 +1,25 @@
+from nose.tools import eq_
+import os
+import subprocess
+import sys
+
+def test_import_does_not_load_dependencies():
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        "import sys, pytcga; print(sorted(m for m in ('pandas', 'requests', 'bs4', 'appdirs') if m in sys.modules))"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    eq_(output.decode().strip(), '[]')
+
+def test_lazy_attributes():
+    import pytcga
+    from pytcga.tcga_mutations import load_mutation_data
+
+    assert pytcga.load_mutation_data is load_mutation_data
+    assert 'load_mutation_data' in dir(pytcga)
+
+def test_submodule_attributes():
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        "import pytcga; print(pytcga.tcga_requests.__name__, hasattr(pytcga, 'no_such_module'))"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    eq_(output.decode().strip(), 'pytcga.tcga_requests False')
@@ -0,0 +1,28 @@
+from nose.tools import eq_, assert_raises
+
+from pytcga.instrumentation import span, SpanRecorder
+
+def test_spans_are_nested_and_recorded():
+    with SpanRecorder() as recorder:
+        with span('outer', disease='LUAD') as outer:
+            with span('inner') as inner:
+                inner.add(bytes=10)
+                inner.add(bytes=5)
+            outer.set(cache='miss')
+
+    eq_([s.name for s in recorder.spans], ['inner', 'outer'])
+    eq_(recorder.spans[0].path, 'outer/inner')
+    eq_(recorder.spans[0].attributes, {'bytes': 15})
+    eq_(recorder.spans[1].attributes, {'disease': 'LUAD', 'cache': 'miss'})
+    assert recorder.spans[1].duration >= recorder.spans[0].duration
+
+    summary = recorder.summary()
+    eq_(summary.loc['inner', 'bytes'], 15)
+
+def test_span_records_errors():
+    with SpanRecorder() as recorder:
+        with assert_raises(ValueError):
+            with span('failing'):
+                raise ValueError('bad')
+
+    assert 'ValueError' in recorder.spans[0].attributes['error']
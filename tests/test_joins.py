@@ -0,0 +1,30 @@
+from nose.tools import eq_
+import numpy as np
+import pandas as pd
+
+from pytcga.tcga_clinical import index_patients
+from pytcga.tcga_utils import attach_columns
+
+PATIENTS = pd.DataFrame({'bcr_patient_barcode': ['TCGA-AA-0001', 'TCGA-AA-0002'],
+                         'gender': ['MALE', 'FEMALE']})
+
+def test_index_patients():
+    barcodes = pd.Series(['TCGA-AA-0002', 'TCGA-AA-0003', np.nan, 'TCGA-AA-0002'])
+    (patient_index, patients) = index_patients(barcodes, PATIENTS)
+
+    eq_(patient_index.tolist(), [1, 2, -1, 1])
+    eq_(patients.index.name, 'patient_index')
+    eq_(patients['bcr_patient_barcode'].tolist(), ['TCGA-AA-0001', 'TCGA-AA-0002', 'TCGA-AA-0003'])
+    assert pd.isnull(patients['gender'][2])
+
+def test_attach_columns():
+    mutations = pd.DataFrame({'Hugo_Symbol': ['TP53', 'KRAS', 'EGFR'],
+                              'patient_index': [1, -1, 0]},
+                             index=[5, 6, 7])
+    joined = attach_columns(mutations, PATIENTS, 'patient_index', columns=['gender'])
+
+    eq_(joined.columns.tolist(), ['Hugo_Symbol', 'patient_index', 'gender'])
+    eq_(joined.index.tolist(), [5, 6, 7])
+    eq_(joined['gender'][5], 'FEMALE')
+    assert pd.isnull(joined['gender'][6])
+    eq_(joined['gender'][7], 'MALE')
@@ -0,0 +1,52 @@
+from nose.tools import eq_
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from pytcga.tcga_mutation_dataset import (write_mutation_partitions,
+                                          mutation_dataset_diseases,
+                                          normalize_chromosome,
+                                          query_mutations)
+
+def _mutations(n):
+    return pd.DataFrame({
+        'Hugo_Symbol': ['TP53', 'EGFR', 'KRAS', 'EGFR'][:n],
+        'Chromosome': ['17', 'chr7', '12', '7'][:n],
+        'Start_position': [7577120, 55249071, 25398284, 55259515][:n],
+        'dbSNP_RS': ['rs1', np.nan, 5, 'novel'][:n],
+    })
+
+def test_normalize_chromosome():
+    eq_(normalize_chromosome('chr7'), '7')
+    eq_(normalize_chromosome('X'), 'X')
+    eq_(normalize_chromosome(7.), '7')
+
+def test_mutation_dataset():
+    directory = tempfile.mkdtemp()
+    try:
+        write_mutation_partitions(_mutations(4), 'luad', path=directory)
+        write_mutation_partitions(_mutations(2), 'LUSC', path=directory)
+        eq_(mutation_dataset_diseases(directory), ['LUAD', 'LUSC'])
+        eq_(sorted(os.listdir(os.path.join(directory, 'disease=LUAD'))),
+            ['Chromosome=12', 'Chromosome=17', 'Chromosome=7'])
+
+        everything = query_mutations(path=directory)
+        eq_(len(everything), 6)
+        eq_(everything['disease'].cat.categories.tolist(), ['LUAD', 'LUSC'])
+
+        egfr = query_mutations(genes=['EGFR'], columns=['Start_position'], path=directory)
+        eq_(egfr.columns.tolist(), ['Start_position', 'disease', 'Chromosome'])
+        eq_(egfr['Start_position'].tolist(), [55249071, 55259515, 55249071])
+
+        region = query_mutations(diseases=['LUAD'], region='chr7:55,000,000-55,250,000', path=directory)
+        eq_(region['Hugo_Symbol'].tolist(), ['EGFR'])
+        eq_(region['Chromosome'].tolist(), ['7'])
+
+        # Writing a cohort again replaces its partitions
+        write_mutation_partitions(_mutations(1), 'LUAD', path=directory)
+        eq_(len(query_mutations(diseases=['LUAD'], path=directory)), 1)
+        eq_(len(query_mutations(chromosomes=['Y'], path=directory)), 0)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,97 @@
+from nose.tools import eq_, ok_, assert_raises
+import os
+
+import requests
+
+from pytcga import tcga_requests, tcga_utils
+from pytcga.tcga_requests import OfflineError, set_offline, is_offline, tcga_request
+from pytcga.tcga_clinical import request_clinical_data, load_clinical_data, load_biospecimen_table
+from pytcga.tcga_barcode_index import load_barcode_index
+from pytcga.tcga_cache import update_manifest
+from pytcga.tcga_utils import load_studies
+
+from cache_helpers import temporary_cache, no_network
+
+def _offline_cache(test):
+    def run(cache_directory):
+        requests.get = requests.post = no_network
+        set_offline()
+        try:
+            test(cache_directory)
+        finally:
+            set_offline(None)
+    run.__name__ = test.__name__
+    return temporary_cache(run)
+
+def test_offline_env_var():
+    environ = os.environ.get(tcga_requests.OFFLINE_ENV_VAR)
+    try:
+        os.environ[tcga_requests.OFFLINE_ENV_VAR] = '1'
+        ok_(is_offline())
+        os.environ[tcga_requests.OFFLINE_ENV_VAR] = 'false'
+        ok_(not is_offline())
+        set_offline()
+        ok_(is_offline())
+    finally:
+        set_offline(None)
+        if environ is None:
+            del os.environ[tcga_requests.OFFLINE_ENV_VAR]
+        else:
+            os.environ[tcga_requests.OFFLINE_ENV_VAR] = environ
+
+@_offline_cache
+def test_offline_clinical_data(cache_directory):
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    # Two patient files, e.g. after the site renamed it, and no manifest
+    for file_name in ['nationwidechildrens.org_clinical_patient_luad.txt',
+                      'clinical_patient_luad.txt']:
+        open(os.path.join(disease_dir, file_name), 'w').close()
+
+    eq_(request_clinical_data('LUAD', max_age=0),
+        os.path.join(disease_dir, 'clinical_patient_luad.txt'))
+
+    with assert_raises(OfflineError) as context:
+        request_clinical_data('BRCA')
+    eq_(context.exception.missing, ['clinical data for BRCA'])
+
+@_offline_cache
+def test_offline_cohort_without_patient_file(cache_directory):
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    aliquot_file = 'nationwidechildrens.org_biospecimen_aliquot_luad.txt'
+    with open(os.path.join(disease_dir, aliquot_file), 'w') as f:
+        f.write('bcr_aliquot_barcode\nCDE_ID:\nTCGA-AA-0001-01A-01D-0001-01\n')
+    update_manifest(disease_dir, {aliquot_file: {'fetched_at': 0}})
+
+    # Cached files are used however old, only missing ones raise
+    aliquots = load_biospecimen_table('LUAD', 'aliquot', max_age=0)
+    eq_(aliquots['bcr_aliquot_barcode'].tolist(), ['TCGA-AA-0001-01A-01D-0001-01'])
+    index = load_barcode_index('LUAD', max_age=0)
+    eq_(index.lookup('TCGA-AA-0001', 'aliquot'), ['TCGA-AA-0001-01A-01D-0001-01'])
+
+    with assert_raises(OfflineError) as context:
+        load_biospecimen_table('LUAD', 'sample')
+    eq_(context.exception.missing, ['biospecimen_sample files for LUAD'])
+    with assert_raises(OfflineError) as context:
+        load_clinical_data('LUAD')
+    eq_(context.exception.missing, ['patient data for LUAD'])
+
+@_offline_cache
+def test_offline_archive(cache_directory):
+    with assert_raises(OfflineError) as context:
+        tcga_request('LUAD', level='3', center='7',
+                     platformType='RNASeqV2', platform='IlluminaHiSeq_RNASeqV2')
+    eq_(len(context.exception.missing), 1)
+    ok_('LUAD' in context.exception.missing[0])
+
+@_offline_cache
+def test_offline_studies(cache_directory):
+    with assert_raises(OfflineError):
+        load_studies()
+
+    cache_path = os.path.join(cache_directory, tcga_utils.STUDIES_CACHE_FILE)
+    with open(cache_path, 'w') as f:
+        f.write('Study Abbreviation,Study Name\nLUAD,Lung adenocarcinoma\n')
+    os.utime(cache_path, (0, 0))
+    eq_(load_studies()['Study Abbreviation'].tolist(), ['LUAD'])
@@ -0,0 +1,77 @@
+from nose.tools import eq_, ok_, assert_raises
+import time
+import pandas as pd
+
+from pytcga import tcga_pancancer
+from pytcga.tcga_requests import RequestError
+from pytcga.tcga_pancancer import combine_cohorts, load_pancancer_data
+
+def test_combine_cohorts():
+    combined = combine_cohorts({'LUAD': pd.DataFrame({'a': [1, 2]}),
+                                'BRCA': pd.DataFrame({'a': [3]})})
+    eq_(combined['a'].tolist(), [1, 2, 3])
+    eq_(combined['disease'].tolist(), ['LUAD', 'LUAD', 'BRCA'])
+    eq_(combined['disease'].cat.categories.tolist(), ['LUAD', 'BRCA'])
+
+    with assert_raises(ValueError):
+        combine_cohorts({'LUAD': (pd.DataFrame(), pd.DataFrame())})
+
+def _prefetch(disease_code, wait_time=30):
+    if disease_code == 'OV':
+        raise RequestError('204', 'No Content')
+    if disease_code == 'GBM':
+        raise ValueError('HTTP 500')
+
+def _load(disease_code, rows=1):
+    return pd.DataFrame({'code': [disease_code] * rows})
+
+def test_load_pancancer_data():
+    data_types = tcga_pancancer.PANCANCER_DATA_TYPES
+    tcga_pancancer.PANCANCER_DATA_TYPES = {'test': (_prefetch, _load)}
+    try:
+        combined = load_pancancer_data('test', ['luad', 'OV', 'BRCA'],
+                                       errors='skip', rows=2)
+        eq_(combined['code'].tolist(), ['LUAD', 'LUAD', 'BRCA', 'BRCA'])
+        eq_(combined['disease'].cat.categories.tolist(), ['LUAD', 'BRCA'])
+
+        cohorts = load_pancancer_data('test', ['BRCA', 'LUAD'], combine=False)
+        eq_(list(cohorts), ['BRCA', 'LUAD'])
+
+        combined = load_pancancer_data('test', ['LUAD', 'GBM'], errors='skip')
+        eq_(combined['code'].tolist(), ['LUAD'])
+
+        with assert_raises(RequestError):
+            load_pancancer_data('test', ['LUAD', 'OV'])
+    finally:
+        tcga_pancancer.PANCANCER_DATA_TYPES = data_types
+
+_started = []
+
+def _fail_first(disease_code, wait_time=30):
+    _started.append(disease_code)
+    if disease_code == 'LUAD':
+        raise RequestError('204', 'No Content')
+    time.sleep(0.05)
+
+def test_load_pancancer_data_cancels_downloads():
+    data_types = tcga_pancancer.PANCANCER_DATA_TYPES
+    tcga_pancancer.PANCANCER_DATA_TYPES = {'test': (_fail_first, _load)}
+    try:
+        with assert_raises(RequestError):
+            load_pancancer_data('test', ['LUAD'] + ['BRCA'] * 10,
+                                network_workers=1, parse_workers=0)
+        time.sleep(0.2)
+        ok_(len(_started) < 4)
+    finally:
+        tcga_pancancer.PANCANCER_DATA_TYPES = data_types
+
+def test_load_pancancer_data_parse_workers():
+    data_types = tcga_pancancer.PANCANCER_DATA_TYPES
+    tcga_pancancer.PANCANCER_DATA_TYPES = {'test': (_prefetch, _load)}
+    try:
+        combined = load_pancancer_data('test', ['LUAD', 'BRCA', 'OV'],
+                                       errors='skip', parse_workers=2, rows=2)
+        eq_(combined['code'].tolist(), ['LUAD', 'LUAD', 'BRCA', 'BRCA'])
+        eq_(combined['disease'].cat.categories.tolist(), ['LUAD', 'BRCA'])
+    finally:
+        tcga_pancancer.PANCANCER_DATA_TYPES = data_types
@@ -0,0 +1,29 @@
+from nose.tools import eq_
+
+from pytcga.progress import ProgressTracker, DownloadProgress, format_progress
+from pytcga.tcga_requests import parse_size
+
+def test_progress_tracker_reports():
+    reports = []
+    tracker = ProgressTracker(lambda p: reports.append((p.bytes_done, p.finished)),
+                              'http://example', total_bytes=100, interval=0)
+    tracker.update(40)
+    tracker.update(60)
+    tracker.finish()
+
+    eq_(reports, [(40, False), (100, False), (100, True)])
+    eq_(tracker.progress.fraction, 1.)
+    eq_(tracker.progress.eta, 0.)
+
+def test_download_progress_eta():
+    progress = DownloadProgress('http://example', total_bytes=1000)
+    progress.bytes_done = 250
+    progress.rate = 50.
+
+    eq_(progress.eta, 15.)
+    assert '25%' in format_progress(progress)
+
+def test_parse_size():
+    eq_(parse_size(2048), 2048)
+    eq_(parse_size('1.5 MB'), 1572864)
+    eq_(parse_size('unknown'), None)
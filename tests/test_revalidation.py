@@ -0,0 +1,107 @@
+from nose.tools import eq_, ok_
+import io
+import os
+import time
+
+import requests
+
+from pytcga.tcga_cache import read_manifest, update_manifest, is_fresh
+from pytcga.tcga_requests import download_file
+from pytcga.tcga_clinical import request_clinical_data
+
+from cache_helpers import temporary_cache
+
+PATIENT_FILE = 'nationwidechildrens.org_clinical_patient_luad.txt'
+
+class _Raw(object):
+    def __init__(self, content):
+        self._body = io.BytesIO(content)
+
+    def read(self, size=-1, decode_content=False):
+        return self._body.read(size)
+
+class _Response(object):
+    def __init__(self, url, status_code=200, content=b'', headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.raw = _Raw(content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+class _Server(object):
+    """Stands in for requests.get, serving files with an ETag and answering
+    conditional requests"""
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        file_name = url.rstrip('/').rsplit('/', 1)[-1]
+        if file_name not in self.files:
+            listing = ''.join('<a href="{}">{}</a>'.format(f, f) for f in sorted(self.files))
+            return _Response(url, content=listing.encode())
+        (etag, content) = self.files[file_name]
+        if headers.get('If-None-Match') == etag:
+            return _Response(url, status_code=304)
+        return _Response(url, content=content, headers={'ETag': etag})
+
+def test_is_fresh():
+    ok_(is_fresh(None, None))
+    ok_(not is_fresh(None, 60))
+    ok_(not is_fresh({'etag': 'a'}, 60))
+    ok_(is_fresh({'fetched_at': time.time() - 10}, 60))
+    ok_(not is_fresh({'fetched_at': time.time() - 100}, 60))
+
+@temporary_cache
+def test_download_file_not_modified(cache_directory):
+    server = _Server({'a.txt': ('"v1"', b'new')})
+    requests.get = server.get
+    output_path = os.path.join(cache_directory, 'a.txt')
+    with open(output_path, 'wb') as f:
+        f.write(b'cached')
+
+    eq_(download_file('http://tcga/a.txt', output_path, validators={'etag': '"v1"'}), None)
+    eq_(server.requests[0][1]['If-None-Match'], '"v1"')
+    eq_(open(output_path, 'rb').read(), b'cached')
+
+    record = download_file('http://tcga/a.txt', output_path, validators={'etag': '"v0"'})
+    eq_(record['etag'], '"v1"')
+    eq_(open(output_path, 'rb').read(), b'new')
+
+@temporary_cache
+def test_request_clinical_data_revalidates(cache_directory):
+    server = _Server({PATIENT_FILE: ('"v1"', b'patients')})
+    requests.get = server.get
+    disease_dir = os.path.join(cache_directory, 'LUAD')
+    os.makedirs(disease_dir)
+    with open(os.path.join(disease_dir, PATIENT_FILE), 'wb') as f:
+        f.write(b'cached')
+    update_manifest(disease_dir, {PATIENT_FILE: {'etag': '"v1"', 'fetched_at': time.time() - 100}})
+
+    # Without a max age cached files never expire
+    request_clinical_data('LUAD')
+    eq_(server.requests, [])
+
+    # Stale, revalidated and found unchanged
+    path = request_clinical_data('LUAD', max_age=60)
+    eq_(len(server.requests), 2)
+    eq_(server.requests[1][1]['If-None-Match'], '"v1"')
+    eq_(open(path, 'rb').read(), b'cached')
+    ok_(time.time() - read_manifest(disease_dir)[PATIENT_FILE]['fetched_at'] < 60)
+
+    # Fresh again
+    request_clinical_data('LUAD', max_age=60)
+    eq_(len(server.requests), 2)
+
+    # Changed on the server
+    server.files[PATIENT_FILE] = ('"v2"', b'updated')
+    update_manifest(disease_dir, {PATIENT_FILE: {'fetched_at': time.time() - 100}})
+    path = request_clinical_data('LUAD', max_age=60)
+    eq_(open(path, 'rb').read(), b'updated')
+    eq_(read_manifest(disease_dir)[PATIENT_FILE]['etag'], '"v2"')
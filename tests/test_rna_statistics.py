@@ -0,0 +1,88 @@
+from nose.tools import eq_
+import io
+import os
+import tarfile
+import numpy as np
+import pandas as pd
+
+from pytcga import tcga_rna
+from pytcga.tcga_rna import GeneStatisticsAccumulator, expression_matrix
+
+from cache_helpers import temporary_cache
+
+def test_gene_statistics_accumulator():
+    rng = np.random.RandomState(0)
+    gene_ids = ['A|1', 'B|2', 'C|3']
+    values = rng.gamma(2., 50., size=(40, len(gene_ids)))
+
+    accumulator = GeneStatisticsAccumulator(quantiles=(0.5,), log2=True, n_bins=1024)
+    for sample_values in values:
+        accumulator.update(gene_ids, sample_values)
+    stats = accumulator.result()
+
+    log_values = np.log2(values + 1)
+    eq_(list(stats.index), gene_ids)
+    eq_(stats['count'].tolist(), [40, 40, 40])
+    assert np.allclose(stats['mean'], log_values.mean(axis=0))
+    assert np.allclose(stats['variance'], log_values.var(axis=0, ddof=1))
+    assert np.allclose(stats['max'], log_values.max(axis=0))
+    assert np.allclose(stats['q50'], np.median(log_values, axis=0), atol=0.05)
+
+def test_gene_statistics_accumulator_reorders_genes():
+    accumulator = GeneStatisticsAccumulator(quantiles=())
+    accumulator.update(['A', 'B'], [1., 10.])
+    accumulator.update(['B', 'A'], [20., 3.])
+    stats = accumulator.result()
+
+    eq_(stats.loc['A', 'mean'], 2.)
+    eq_(stats.loc['B', 'mean'], 15.)
+
+def test_gene_statistics_accumulator_missing_genes():
+    accumulator = GeneStatisticsAccumulator(quantiles=(0.5,))
+    accumulator.update(['A', 'B'], [1., 10.])
+    accumulator.update(['A'], [3.])
+    accumulator.update(['A', 'B'], [5., 20.])
+    stats = accumulator.result()
+
+    eq_(stats['count'].tolist(), [3, 2])
+    eq_(stats['mean'].tolist(), [3., 15.])
+    eq_(stats['variance'].tolist(), [4., 50.])
+
+@temporary_cache
+def test_iter_rnaseq_sample_files_from_archive(cache_directory):
+    prefetch = tcga_rna.prefetch_rnaseq_data
+    try:
+        archive_path = os.path.join(cache_directory, 'rnaseq.tar')
+        files = {
+            'FILE_SAMPLE_MAP.txt': 'filename\tbarcode(s)\n'
+                                   'b.genes.normalized_results\tTCGA-AA-0002-01A-01R-0001-07\n'
+                                   'a.genes.normalized_results\tTCGA-AA-0001-01A-01R-0001-07\n',
+            'a.genes.normalized_results': 'a',
+            'b.genes.normalized_results': 'b',
+        }
+        with tarfile.open(archive_path, 'w') as archive:
+            for (name, content) in sorted(files.items(), reverse=True):
+                info = tarfile.TarInfo('archive/' + name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content.encode()))
+
+        tcga_rna.prefetch_rnaseq_data = lambda disease_code, wait_time=30: archive_path
+        eq_([f.read() for f in tcga_rna._iter_rnaseq_sample_files('LUAD')], [b'b', b'a'])
+    finally:
+        tcga_rna.prefetch_rnaseq_data = prefetch
+
+def test_expression_matrix():
+    first = pd.DataFrame({'gene_id': ['A|1', 'B|2'], 'normalized_count': [1., 2.]})
+    second = pd.DataFrame({'gene_id': ['A|1', 'B|2'], 'normalized_count': [3., 4.]})
+    expression = expression_matrix([first, second], ['S1', 'S2'])
+    eq_(list(expression.index), ['A|1', 'B|2'])
+    eq_(list(expression.columns), ['S1', 'S2'])
+    eq_(expression.values.tolist(), [[1., 3.], [2., 4.]])
+
+    # Files listing genes in another order or missing some
+    third = pd.DataFrame({'gene_id': ['C|3', 'A|1'], 'normalized_count': [5., 6.]})
+    expression = expression_matrix([first, third], ['S1', 'S3'])
+    eq_(list(expression.index), ['A|1', 'B|2', 'C|3'])
+    eq_(expression.loc['A|1'].tolist(), [1., 6.])
+    assert np.isnan(expression.loc['B|2', 'S3'])
+    eq_(expression.loc['C|3', 'S3'], 5.)
@@ -0,0 +1,81 @@
+from nose.tools import eq_
+import os
+import tempfile
+
+from pytcga import tcga_utils
+from pytcga.tcga_utils import (load_tcga_tabfile,
+                               load_tcga_tabfiles,
+                               barcode_prefix,
+                               load_studies)
+
+from cache_helpers import temporary_cache
+
+BIOTAB = ("bcr_patient_barcode\tgender\tage\n"
+          "bcr_patient_barcode\tgender\tage_at_initial_pathologic_diagnosis\n"
+          "CDE_ID:2003301\tCDE_ID:2200604\tCDE_ID:2006657\n"
+          "TCGA-05-4244\tMALE\t70\n"
+          "TCGA-05-4249\tFEMALE\t[Not Available]\n")
+
+def _write_biotab(skip_name_rows=0):
+    handle, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(handle, 'w') as f:
+        f.write(BIOTAB.split('\n', skip_name_rows)[-1])
+    return path
+
+def test_load_tcga_tabfile():
+    path = _write_biotab(skip_name_rows=1)
+    df = load_tcga_tabfile(path)
+    os.remove(path)
+
+    eq_(list(df.columns), ['bcr_patient_barcode', 'gender', 'age_at_initial_pathologic_diagnosis'])
+    eq_(df['gender'].tolist(), ['MALE', 'FEMALE'])
+    eq_(df['age_at_initial_pathologic_diagnosis'][0], 70)
+
+def test_load_tcga_tabfile_skiprows():
+    path = _write_biotab()
+    df = load_tcga_tabfile(path,
+                           skiprows=1,
+                           dtype={'age_at_initial_pathologic_diagnosis': str},
+                           usecols=['bcr_patient_barcode', 'age_at_initial_pathologic_diagnosis'])
+    os.remove(path)
+
+    eq_(list(df.columns), ['bcr_patient_barcode', 'age_at_initial_pathologic_diagnosis'])
+    eq_(df['bcr_patient_barcode'].tolist(), ['TCGA-05-4244', 'TCGA-05-4249'])
+    eq_(df['age_at_initial_pathologic_diagnosis'][0], '70')
+    assert df['age_at_initial_pathologic_diagnosis'].isnull()[1]
+
+def test_load_tcga_tabfiles_keeps_order():
+    paths = []
+    for i in range(6):
+        handle, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as f:
+            f.write('bcr_sample_barcode\nCDE_ID:\nTCGA-AA-{:04d}-01A\n'.format(i))
+        paths.append(path)
+
+    dfs = load_tcga_tabfiles(paths, max_workers=4)
+    for path in paths:
+        os.remove(path)
+
+    eq_([df['bcr_sample_barcode'][0] for df in dfs],
+        ['TCGA-AA-{:04d}-01A'.format(i) for i in range(6)])
+
+def test_barcode_prefix():
+    barcodes = ['TCGA-02-0001-01C-01D-0182-01']
+
+    eq_(barcode_prefix(barcodes, 'patient').tolist(), ['TCGA-02-0001'])
+    eq_(barcode_prefix(barcodes, 'sample').tolist(), ['TCGA-02-0001-01C'])
+    eq_(barcode_prefix(barcodes, 'analyte').tolist(), ['TCGA-02-0001-01C-01D'])
+
+@temporary_cache
+def test_load_studies_uses_cached_copy(cache_directory):
+    code_table_address = tcga_utils.CODE_TABLE_ADDRESS
+    try:
+        tcga_utils.CODE_TABLE_ADDRESS = 'http://127.0.0.1:9/codeTablesExport.htm'
+        with open(os.path.join(cache_directory, tcga_utils.STUDIES_CACHE_FILE), 'w') as f:
+            f.write('Study Abbreviation,Study Name\nLUAD,Lung adenocarcinoma\n')
+
+        eq_(load_studies()['Study Abbreviation'].tolist(), ['LUAD'])
+        # Stale copies are still used when the code table is unreachable
+        eq_(load_studies(max_age=0)['Study Name'].tolist(), ['Lung adenocarcinoma'])
+    finally:
+        tcga_utils.CODE_TABLE_ADDRESS = code_table_address